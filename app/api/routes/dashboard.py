@@ -15,7 +15,7 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/stats")
-async def get_dashboard_stats(db: Session = Depends(get_db)):
+def get_dashboard_stats(db: Session = Depends(get_db)):
     """Get dashboard statistics"""
     
     try:
@@ -91,7 +91,7 @@ async def get_dashboard_stats(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/trends")
-async def get_trends_data(days: int = 30, db: Session = Depends(get_db)):
+def get_trends_data(days: int = 30, db: Session = Depends(get_db)):
     """Get trends data for charts"""
     
     try:
@@ -153,7 +153,7 @@ async def get_trends_data(days: int = 30, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/repositories/{repo_id}/analytics")
-async def get_repository_analytics(repo_id: int, db: Session = Depends(get_db)):
+def get_repository_analytics(repo_id: int, db: Session = Depends(get_db)):
     """Get analytics for a specific repository"""
     
     try:
@@ -231,7 +231,7 @@ async def get_repository_analytics(repo_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/sessions")
-async def get_recent_sessions(limit: int = 20, db: Session = Depends(get_db)):
+def get_recent_sessions(limit: int = 20, db: Session = Depends(get_db)):
     """Get recent review sessions"""
     
     try:
@@ -3,9 +3,12 @@ Code Review API Routes
 """
 
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
+import asyncio
 import logging
+import orjson
 import uuid
 from datetime import datetime
 
@@ -14,7 +17,7 @@ from app.services.code_analysis import CodeAnalysisService
 from app.services.github_service import GitHubService
 from app.services.static_analysis import StaticAnalysisService
 from app.schemas.review import (
-    ReviewRequest, ReviewResponse, ReviewSessionResponse,
+    ReviewRequest, ReviewSessionResponse,
     CodeReviewItem, AnalysisResult
 )
 
@@ -27,7 +30,7 @@ github_service = GitHubService()
 static_analysis_service = StaticAnalysisService()
 
 @router.post("/analyze", response_model=ReviewSessionResponse)
-async def analyze_pull_request(
+def analyze_pull_request(
     request: ReviewRequest,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
@@ -43,7 +46,7 @@ async def analyze_pull_request(
             pull_request_id=request.pull_request_id,
             status="pending",
             total_files=len(request.files),
-            metadata=request.dict()
+            meta=request.model_dump()
         )
         db.add(review_session)
         db.commit()
@@ -68,7 +71,7 @@ async def analyze_pull_request(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/session/{session_id}", response_model=ReviewSessionResponse)
-async def get_review_session(session_id: str, db: Session = Depends(get_db)):
+def get_review_session(session_id: str, db: Session = Depends(get_db)):
     """Get review session status and results"""
     
     session = db.query(ReviewSession).filter(ReviewSession.session_id == session_id).first()
@@ -87,7 +90,7 @@ async def get_review_session(session_id: str, db: Session = Depends(get_db)):
     )
 
 @router.get("/session/{session_id}/results", response_model=List[CodeReviewItem])
-async def get_review_results(session_id: str, db: Session = Depends(get_db)):
+def get_review_results(session_id: str, db: Session = Depends(get_db)):
     """Get detailed review results for a session"""
     
     session = db.query(ReviewSession).filter(ReviewSession.session_id == session_id).first()
@@ -117,12 +120,57 @@ async def get_review_results(session_id: str, db: Session = Depends(get_db)):
         for review in reviews
     ]
 
+@router.get("/session/{session_id}/summary/stream")
+async def stream_review_summary(session_id: str, db: Session = Depends(get_db)):
+    """Stream an AI summary of a review session as server-sent events"""
+    
+    def _load_session_results():
+        session = db.query(ReviewSession).filter(ReviewSession.session_id == session_id).first()
+        if not session:
+            return None, []
+        reviews = db.query(CodeReview).filter(
+            CodeReview.repository_id == session.repository_id,
+            CodeReview.pull_request_id == session.pull_request_id,
+            CodeReview.review_type != "summary"
+        ).all()
+        return session, reviews
+    
+    session, reviews = await asyncio.to_thread(_load_session_results)
+    if not session:
+        raise HTTPException(status_code=404, detail="Review session not found")
+    
+    # Rebuild per-file analysis results from stored reviews
+    issue_keys = {"bug": "bugs", "security": "security_issues", "quality": "quality_issues"}
+    results_by_file: Dict[str, Dict[str, Any]] = {}
+    for review in reviews:
+        result = results_by_file.setdefault(
+            review.file_path,
+            {"bugs": [], "security_issues": [], "quality_issues": []}
+        )
+        key = issue_keys.get(review.review_type)
+        if key:
+            result[key].append({"line": review.line_number, "title": review.title})
+    
+    session_meta = session.meta or {}
+    
+    async def _events():
+        async for text in code_analysis_service.generate_review_summary_stream(
+            repository_name=f"{session_meta.get('owner')}/{session_meta.get('repo')}",
+            pr_title=session_meta.get("pr_title", ""),
+            analysis_results=list(results_by_file.values())
+        ):
+            yield b"data: " + orjson.dumps(text) + b"\n\n"
+        yield b"event: done\ndata: {}\n\n"
+    
+    return StreamingResponse(_events(), media_type="text/event-stream")
+
 @router.post("/manual", response_model=AnalysisResult)
 async def analyze_code_manually(
     code: str,
     file_path: str,
     language: str,
-    repository_name: str = "manual-analysis"
+    repository_name: str = "manual-analysis",
+    deep: bool = False
 ):
     """Manually analyze code without GitHub integration"""
     
@@ -134,7 +182,8 @@ async def analyze_code_manually(
             language=language,
             repository_name=repository_name,
             pr_title="Manual Analysis",
-            changed_lines=[]
+            changed_lines=[],
+            deep=deep
         )
         
         # Run static analysis
@@ -160,7 +209,7 @@ async def analyze_code_manually(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/repositories", response_model=List[Dict[str, Any]])
-async def get_repositories(db: Session = Depends(get_db)):
+def get_repositories(db: Session = Depends(get_db)):
     """Get all tracked repositories"""
     
     repositories = db.query(Repository).filter(Repository.is_active == True).all()
@@ -179,7 +228,7 @@ async def get_repositories(db: Session = Depends(get_db)):
     ]
 
 @router.get("/repositories/{repo_id}/pull-requests", response_model=List[Dict[str, Any]])
-async def get_pull_requests(repo_id: int, db: Session = Depends(get_db)):
+def get_pull_requests(repo_id: int, db: Session = Depends(get_db)):
     """Get pull requests for a repository"""
     
     pull_requests = db.query(PullRequest).filter(
@@ -205,50 +254,75 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
     
     try:
         # Update session status
-        session = db.query(ReviewSession).filter(ReviewSession.session_id == session_id).first()
+        session = await asyncio.to_thread(
+            lambda: db.query(ReviewSession).filter(ReviewSession.session_id == session_id).first()
+        )
         session.status = "running"
-        db.commit()
+        await asyncio.to_thread(db.commit)
         
         total_issues = 0
         
-        # Analyze each file
-        for i, file_info in enumerate(request.files):
-            try:
-                # Get file content from GitHub
-                file_content = await github_service.get_file_content(
-                    owner=request.owner,
-                    repo=request.repo,
-                    file_path=file_info["path"],
-                    ref=request.head_sha
-                )
-                
-                if not file_content:
-                    logger.warning(f"Could not get content for {file_info['path']}")
-                    continue
-                
-                # Run AI analysis
-                ai_result = await code_analysis_service.analyze_code(
-                    code=file_content,
-                    file_path=file_info["path"],
-                    language=file_info.get("language", "unknown"),
-                    repository_name=f"{request.owner}/{request.repo}",
-                    pr_title=request.pr_title,
-                    changed_lines=file_info.get("changed_lines", [])
-                )
-                
-                # Run static analysis
-                static_result = await static_analysis_service.analyze_code(
+        # Fetch file contents, then analyze every file concurrently; a file that fails
+        # is logged and skipped instead of failing the whole session
+        contents = await asyncio.gather(*(
+            github_service.get_file_content(
+                owner=request.owner,
+                repo=request.repo,
+                file_path=file_info.path,
+                ref=request.head_sha
+            )
+            for file_info in request.files
+        ), return_exceptions=True)
+        
+        files = []
+        for file_info, file_content in zip(request.files, contents):
+            if isinstance(file_content, Exception):
+                logger.error(f"Error fetching {file_info.path}: {str(file_content)}")
+                continue
+            if not file_content:
+                logger.warning(f"Could not get content for {file_info.path}")
+                continue
+            files.append((file_info, file_content))
+        
+        # analyze_pr reports a failed file in that file's result rather than raising
+        ai_results, static_results = await asyncio.gather(
+            code_analysis_service.analyze_pr(
+                files=[
+                    {
+                        "code": file_content,
+                        "file_path": file_info.path,
+                        "language": file_info.language or "unknown",
+                        "changed_lines": file_info.changed_lines or []
+                    }
+                    for file_info, file_content in files
+                ],
+                repository_name=f"{request.owner}/{request.repo}",
+                pr_title=request.pr_title,
+                deep=request.deep
+            ),
+            asyncio.gather(*(
+                static_analysis_service.analyze_code(
                     code=file_content,
-                    language=file_info.get("language", "unknown"),
-                    file_path=file_info["path"]
+                    language=file_info.language or "unknown",
+                    file_path=file_info.path
                 )
+                for file_info, file_content in files
+            ), return_exceptions=True)
+        )
+        
+        # Save results file by file
+        for i, ((file_info, _), ai_result, static_result) in enumerate(zip(files, ai_results, static_results)):
+            try:
+                if isinstance(static_result, Exception):
+                    logger.error(f"Error in static analysis for {file_info.path}: {str(static_result)}")
+                    static_result = {}
                 
                 # Save AI analysis results
                 for bug in ai_result.get("bugs", []):
                     review = CodeReview(
                         repository_id=request.repository_id,
                         pull_request_id=request.pull_request_id,
-                        file_path=file_info["path"],
+                        file_path=file_info.path,
                         line_number=bug.get("line"),
                         review_type="bug",
                         severity=bug.get("severity", "medium"),
@@ -256,7 +330,7 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
                         description=bug.get("description", ""),
                         suggestion=bug.get("suggestion", ""),
                         ai_confidence=bug.get("confidence", 75),
-                        metadata={"source": "ai", "analysis_type": "bug"}
+                        meta={"source": "ai", "analysis_type": "bug"}
                     )
                     db.add(review)
                     total_issues += 1
@@ -266,7 +340,7 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
                     review = CodeReview(
                         repository_id=request.repository_id,
                         pull_request_id=request.pull_request_id,
-                        file_path=file_info["path"],
+                        file_path=file_info.path,
                         line_number=security_issue.get("line"),
                         review_type="security",
                         severity=security_issue.get("severity", "high"),
@@ -274,7 +348,7 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
                         description=security_issue.get("description", ""),
                         suggestion=security_issue.get("suggestion", ""),
                         ai_confidence=security_issue.get("confidence", 85),
-                        metadata={"source": "ai", "analysis_type": "security"}
+                        meta={"source": "ai", "analysis_type": "security"}
                     )
                     db.add(review)
                     total_issues += 1
@@ -284,7 +358,7 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
                     review = CodeReview(
                         repository_id=request.repository_id,
                         pull_request_id=request.pull_request_id,
-                        file_path=file_info["path"],
+                        file_path=file_info.path,
                         line_number=security_issue.get("line"),
                         review_type="security",
                         severity=security_issue.get("severity", "medium"),
@@ -292,7 +366,7 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
                         description=security_issue.get("description", ""),
                         suggestion=security_issue.get("suggestion", ""),
                         ai_confidence=security_issue.get("confidence", 80),
-                        metadata={"source": "static", "tool": security_issue.get("tool")}
+                        meta={"source": "static", "tool": security_issue.get("tool")}
                     )
                     db.add(review)
                     total_issues += 1
@@ -300,10 +374,11 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
                 # Update progress
                 session.processed_files = i + 1
                 session.total_issues = total_issues
-                db.commit()
+                await asyncio.to_thread(db.commit)
                 
             except Exception as e:
-                logger.error(f"Error analyzing file {file_info['path']}: {str(e)}")
+                logger.error(f"Error saving results for {file_info.path}: {str(e)}")
+                await asyncio.to_thread(db.rollback)
                 continue
         
         # Generate summary
@@ -311,7 +386,7 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
             summary = await code_analysis_service.generate_review_summary(
                 repository_name=f"{request.owner}/{request.repo}",
                 pr_title=request.pr_title,
-                analysis_results=[ai_result]  # Simplified for now
+                analysis_results=ai_results
             )
             
             # Create summary review
@@ -326,7 +401,7 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
                 description=summary,
                 suggestion="",
                 ai_confidence=90,
-                metadata={"source": "ai", "analysis_type": "summary"}
+                meta={"source": "ai", "analysis_type": "summary"}
             )
             db.add(summary_review)
             
@@ -336,7 +411,7 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
         # Complete session
         session.status = "completed"
         session.completed_at = datetime.utcnow()
-        db.commit()
+        await asyncio.to_thread(db.commit)
         
         logger.info(f"Code analysis completed for session {session_id}")
         
@@ -344,4 +419,4 @@ async def _run_code_analysis(session_id: str, request: ReviewRequest, db: Sessio
         logger.error(f"Error in background analysis: {str(e)}")
         session.status = "failed"
         session.error_message = str(e)
-        db.commit()
+        await asyncio.to_thread(db.commit)
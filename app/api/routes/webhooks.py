@@ -3,12 +3,21 @@ GitHub Webhook API Routes
 """
 
 from fastapi import APIRouter, Request, HTTPException, Depends, BackgroundTasks
-from sqlalchemy.orm import Session
-import json
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import msgspec
 import logging
-from typing import Dict, Any
+import re
+from cachetools import TTLCache
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional
 
-from app.core.database import get_db, Repository, PullRequest
+from app.core.cache import redis_client
+from app.core.config import settings
+from app.core.database import get_async_db, AsyncSessionLocal, Repository, PullRequest, Commit, WebhookInbox
 from app.services.github_service import GitHubService
 from app.schemas.webhook import WebhookPayload
 
@@ -18,56 +27,181 @@ router = APIRouter()
 # Initialize GitHub service
 github_service = GitHubService()
 
+# File extension to language mapping (read-only, built once at import)
+_EXT_TO_LANG: Mapping[str, str] = MappingProxyType({
+    '.py': 'python',
+    '.js': 'javascript',
+    '.ts': 'typescript',
+    '.jsx': 'javascript',
+    '.tsx': 'typescript',
+    '.java': 'java',
+    '.cpp': 'cpp',
+    '.c': 'c',
+    '.h': 'c',
+    '.go': 'go',
+    '.rs': 'rust',
+    '.php': 'php',
+    '.rb': 'ruby',
+    '.swift': 'swift',
+    '.kt': 'kotlin',
+    '.scala': 'scala',
+    '.sh': 'shell',
+    '.sql': 'sql',
+    '.html': 'html',
+    '.css': 'css',
+    '.scss': 'scss',
+    '.sass': 'sass',
+    '.xml': 'xml',
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.json': 'json',
+    '.md': 'markdown',
+    '.txt': 'text'
+})
+
+# File statuses worth analyzing
+_ANALYZED_STATUSES = frozenset({"added", "modified"})
+
+# Hunk header, capturing the start line of the new file side
+_HUNK_RE = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)')
+
+# Recently seen X-GitHub-Delivery ids, oldest first
+_recent_deliveries: "OrderedDict[str, None]" = OrderedDict()
+_RECENT_DELIVERIES_MAX = 4096
+_DELIVERY_TTL_SECONDS = 3600
+
+# Repository full_name -> (fields last written, repositories.id) for recently seen repositories;
+# a payload whose fields differ misses the cache and is upserted again
+_repo_id_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
 @router.post("/github")
 async def github_webhook(
     request: Request,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Handle GitHub webhook events"""
     
+    delivery_id = request.headers.get("X-GitHub-Delivery", "")
+    
     try:
-        # Get request body and signature
-        body = await request.body()
         signature = request.headers.get("X-Hub-Signature-256", "")
         event_type = request.headers.get("X-GitHub-Event", "")
         
+        # Reject oversized payloads before reading the body
+        content_length = request.headers.get("content-length", "0")
+        if not content_length.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if int(content_length) > settings.WEBHOOK_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Payload too large")
+        
+        # Read the body, hashing each chunk as it arrives
+        mac = github_service.new_webhook_mac()
+        chunks = []
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.WEBHOOK_MAX_BODY_BYTES:
+                raise HTTPException(status_code=413, detail="Payload too large")
+            mac.update(chunk)
+            chunks.append(chunk)
+        body = b"".join(chunks)
+        
         # Verify webhook signature
-        if not github_service.verify_webhook_signature(body, signature):
+        if not github_service.verify_webhook_digest(mac, signature):
             logger.warning("Invalid webhook signature")
             raise HTTPException(status_code=401, detail="Invalid signature")
         
-        # Parse payload
-        payload = json.loads(body.decode('utf-8'))
+        # Parse payload before claiming the delivery, so a malformed body leaves it unclaimed
+        payload = msgspec.json.decode(body, type=WebhookPayload)
         
-        logger.info(f"Received GitHub webhook: {event_type}")
+        # Skip retried deliveries; only signed requests may claim an id
+        if not await _claim_delivery(delivery_id):
+            return {"status": "duplicate", "event": event_type}
         
-        # Handle different event types
-        if event_type == "pull_request":
-            await _handle_pull_request_event(payload, background_tasks, db)
-        elif event_type == "push":
-            await _handle_push_event(payload, background_tasks, db)
-        elif event_type == "repository":
-            await _handle_repository_event(payload, background_tasks, db)
-        else:
-            logger.info(f"Unhandled event type: {event_type}")
+        logger.info("Received GitHub webhook: %s", event_type)
         
-        return {"status": "success", "event": event_type}
+        # Record the delivery, then process it after the response is sent
+        stmt = _insert(db, WebhookInbox).values(
+            delivery_id=delivery_id or None,
+            event_type=event_type,
+            body=body
+        ).on_conflict_do_nothing(index_elements=["delivery_id"]).returning(WebhookInbox.id)
+        inbox_id = (await db.execute(stmt)).scalar()
+        await db.commit()
         
-    except json.JSONDecodeError:
+        if inbox_id is None:
+            logger.info("Skipping already recorded delivery for %s", event_type)
+            return {"status": "duplicate", "event": event_type}
+        
+        background_tasks.add_task(_process_webhook, inbox_id, event_type, payload)
+        
+        return {"status": "accepted", "event": event_type}
+        
+    except HTTPException:
+        raise
+    except msgspec.DecodeError:
         logger.error("Invalid JSON payload")
         raise HTTPException(status_code=400, detail="Invalid JSON")
     except Exception as e:
         logger.error(f"Error processing webhook: {str(e)}")
+        # Let GitHub's retry of this delivery through
+        await _release_delivery(delivery_id)
         raise HTTPException(status_code=500, detail=str(e))
 
-async def _handle_pull_request_event(payload: Dict[str, Any], background_tasks: BackgroundTasks, db: Session):
+async def _process_webhook(inbox_id: int, event_type: str, payload: WebhookPayload):
+    """Process a recorded webhook delivery outside the request path"""
+    
+    async with AsyncSessionLocal() as db:
+        status = "processed"
+        try:
+            # Handle different event types
+            if event_type == "pull_request":
+                await _handle_pull_request_event(payload, db)
+            elif event_type == "push":
+                await _handle_push_event(payload, db)
+            elif event_type == "repository":
+                await _handle_repository_event(payload, db)
+            else:
+                logger.info("Unhandled event type: %s", event_type)
+        except Exception:
+            # Handlers roll back and log their own errors; keep the row for inspection
+            status = "failed"
+        
+        await db.execute(
+            update(WebhookInbox)
+            .where(WebhookInbox.id == inbox_id)
+            .values(status=status, processed_at=func.now())
+        )
+        await db.commit()
+
+async def _handle_pull_request_event(payload: WebhookPayload, db: AsyncSession):
     """Handle pull request webhook events"""
     
+    analysis_args = await _persist_pr_event(payload, db)
+    if analysis_args:
+        await _trigger_code_analysis(*analysis_args)
+
+async def _persist_pr_event(payload: WebhookPayload, db: AsyncSession) -> Optional[tuple]:
+    """Persist a pull request event, returning code analysis arguments if analysis is needed"""
+    
     try:
-        action = payload.get("action")
-        pr_data = payload.get("pull_request", {})
-        repo_data = payload.get("repository", {})
+        action = payload.action
+        pr_data = payload.pull_request or {}
+        repo_data = payload.repository or {}
+        
+        # Extract pull request info once
+        head = pr_data.get("head") or {}
+        base = pr_data.get("base") or {}
+        user = pr_data.get("user") or {}
+        head_sha = head.get("sha")
+        base_sha = base.get("sha")
+        author = user.get("login")
+        gid = pr_data.get("id")
+        number = pr_data.get("number")
+        title = pr_data.get("title")
+        body = pr_data.get("body")
+        state = pr_data.get("state")
         
         # Extract repository info
         owner = repo_data.get("owner", {}).get("login")
@@ -76,107 +210,207 @@ async def _handle_pull_request_event(payload: Dict[str, Any], background_tasks:
         
         if not all([owner, repo_name, repo_full_name]):
             logger.error("Missing repository information in webhook")
-            return
+            return None
         
-        # Get or create repository record
-        repository = db.query(Repository).filter(
-            Repository.full_name == repo_full_name
-        ).first()
+        analysis_args = None
         
-        if not repository:
-            repository = Repository(
-                github_id=repo_data.get("id"),
-                name=repo_name,
-                full_name=repo_full_name,
-                owner=owner,
-                url=repo_data.get("html_url")
-            )
-            db.add(repository)
-            db.commit()
-            db.refresh(repository)
+        # Upsert repository record unless it was written recently with the same fields
+        repo_fields = _repository_fields(repo_data)
+        repository_id = _cached_repository_id(repo_fields)
+        if repository_id is None:
+            repository_id = await _upsert_repository(db, repo_fields)
         
         # Handle different PR actions
         if action in ["opened", "synchronize"]:
-            # Get or create pull request record
-            pr_number = pr_data.get("number")
-            pr = db.query(PullRequest).filter(
-                PullRequest.github_id == pr_data.get("id")
-            ).first()
-            
-            if not pr:
-                pr = PullRequest(
-                    github_id=pr_data.get("id"),
-                    repository_id=repository.id,
-                    number=pr_number,
-                    title=pr_data.get("title"),
-                    body=pr_data.get("body"),
-                    state=pr_data.get("state"),
-                    author=pr_data.get("user", {}).get("login"),
-                    head_sha=pr_data.get("head", {}).get("sha"),
-                    base_sha=pr_data.get("base", {}).get("sha")
-                )
-                db.add(pr)
-                db.commit()
-                db.refresh(pr)
-            else:
-                # Update existing PR
-                pr.title = pr_data.get("title")
-                pr.body = pr_data.get("body")
-                pr.state = pr_data.get("state")
-                pr.head_sha = pr_data.get("head", {}).get("sha")
-                pr.base_sha = pr_data.get("base", {}).get("sha")
-                db.commit()
+            # Upsert pull request record
+            pr_id = await _upsert_pull_request(db, {
+                "github_id": gid,
+                "repository_id": repository_id,
+                "number": number,
+                "title": title,
+                "body": body,
+                "state": state,
+                "author": author,
+                "head_sha": head_sha,
+                "base_sha": base_sha
+            })
             
             # Trigger code analysis for new/updated PRs
             if action == "opened" or (action == "synchronize" and pr_data.get("draft") == False):
-                background_tasks.add_task(
-                    _trigger_code_analysis,
-                    repository.id,
-                    pr.id,
+                analysis_args = (
+                    repository_id,
+                    pr_id,
                     owner,
                     repo_name,
-                    pr_number,
-                    pr_data.get("title", ""),
-                    pr_data.get("head", {}).get("sha"),
-                    pr_data.get("base", {}).get("sha")
+                    number,
+                    title or "",
+                    head_sha,
+                    base_sha
                 )
         
         elif action == "closed":
             # Update PR state
-            pr = db.query(PullRequest).filter(
-                PullRequest.github_id == pr_data.get("id")
-            ).first()
-            
-            if pr:
-                pr.state = "closed"
-                db.commit()
+            await db.execute(
+                update(PullRequest)
+                .where(PullRequest.github_id == gid)
+                .values(state="closed")
+            )
         
-        logger.info(f"Processed PR {action} event for {repo_full_name}#{pr_data.get('number')}")
+        await db.commit()
+        _repo_id_cache[repo_full_name] = (repo_fields, repository_id)
+        
+        logger.info("Processed PR %s event for %s#%s", action, repo_full_name, number)
+        return analysis_args
         
     except Exception as e:
         logger.error(f"Error handling PR event: {str(e)}")
+        await db.rollback()
+        raise
+
+async def _claim_delivery(delivery_id: str) -> bool:
+    """Record a webhook delivery id, returning False if it was already seen"""
+    
+    if not delivery_id:
+        return True
+    
+    if delivery_id in _recent_deliveries:
+        return False
+    
+    if redis_client is not None:
+        try:
+            claimed = await redis_client.set(
+                f"webhook:delivery:{delivery_id}", 1, nx=True, ex=_DELIVERY_TTL_SECONDS
+            )
+            if not claimed:
+                return False
+        except Exception as e:
+            logger.warning(f"Redis delivery check failed: {str(e)}")
+    
+    _recent_deliveries[delivery_id] = None
+    while len(_recent_deliveries) > _RECENT_DELIVERIES_MAX:
+        _recent_deliveries.popitem(last=False)
+    
+    return True
+
+async def _release_delivery(delivery_id: str):
+    """Forget a webhook delivery id so a retry is processed"""
+    
+    if not delivery_id:
+        return
+    
+    _recent_deliveries.pop(delivery_id, None)
+    
+    if redis_client is not None:
+        try:
+            await redis_client.delete(f"webhook:delivery:{delivery_id}")
+        except Exception as e:
+            logger.warning(f"Redis delivery release failed: {str(e)}")
+
+def _insert(db: AsyncSession, model):
+    """Build a dialect-specific INSERT supporting ON CONFLICT"""
+    if db.bind.dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+def _repository_fields(repo_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the repository columns written from a webhook payload"""
+    return {
+        "github_id": repo_data.get("id"),
+        "name": repo_data.get("name"),
+        "full_name": repo_data.get("full_name"),
+        "owner": repo_data.get("owner", {}).get("login"),
+        "url": repo_data.get("html_url")
+    }
+
+def _cached_repository_id(fields: Dict[str, Any]) -> Optional[int]:
+    """Get a recently upserted repository id if its stored fields are unchanged"""
+    cached = _repo_id_cache.get(fields["full_name"])
+    if cached is not None and cached[0] == fields:
+        return cached[1]
+    return None
+
+async def _upsert_repository(db: AsyncSession, fields: Dict[str, Any]) -> int:
+    """Insert or update a repository keyed on github_id, returning its id"""
+    
+    stmt = _insert(db, Repository).values(**fields)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["github_id"],
+        set_={
+            "name": stmt.excluded.name,
+            "full_name": stmt.excluded.full_name,
+            "owner": stmt.excluded.owner,
+            "url": stmt.excluded.url,
+            "updated_at": func.now()
+        }
+    ).returning(Repository.id)
+    
+    return (await db.execute(stmt)).scalar_one()
+
+async def _upsert_pull_request(db: AsyncSession, fields: Dict[str, Any]) -> int:
+    """Insert or update a pull request keyed on github_id, returning its id"""
+    
+    stmt = _insert(db, PullRequest).values(**fields)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["github_id"],
+        set_={
+            "title": stmt.excluded.title,
+            "body": stmt.excluded.body,
+            "state": stmt.excluded.state,
+            "head_sha": stmt.excluded.head_sha,
+            "base_sha": stmt.excluded.base_sha,
+            "updated_at": func.now()
+        }
+    ).returning(PullRequest.id)
+    
+    return (await db.execute(stmt)).scalar_one()
 
-async def _handle_push_event(payload: Dict[str, Any], background_tasks: BackgroundTasks, db: Session):
+async def _handle_push_event(payload: WebhookPayload, db: AsyncSession):
     """Handle push webhook events"""
     
     try:
-        repo_data = payload.get("repository", {})
-        commits = payload.get("commits", [])
+        repo_data = payload.repository or {}
+        commits = payload.commits
+        
+        repo_full_name = repo_data.get("full_name")
+        
+        logger.info("Received push event for %s with %d commits", repo_full_name, len(commits))
+        
+        if not commits or not repo_full_name:
+            return
         
-        logger.info(f"Received push event for {repo_data.get('full_name')} with {len(commits)} commits")
+        repo_fields = _repository_fields(repo_data)
+        repository_id = _cached_repository_id(repo_fields)
+        if repository_id is None:
+            repository_id = await _upsert_repository(db, repo_fields)
         
-        # Could trigger analysis for specific branches or commits
-        # For now, just log the event
+        # Stage all commits as one multi-row INSERT rather than per-commit ORM objects
+        rows = [
+            {
+                "repository_id": repository_id,
+                "sha": commit.get("id"),
+                "author": (commit.get("author") or {}).get("name"),
+                "message": commit.get("message")
+            }
+            for commit in commits
+        ]
+        await db.execute(
+            _insert(db, Commit).on_conflict_do_nothing(index_elements=["repository_id", "sha"]),
+            rows
+        )
+        await db.commit()
+        _repo_id_cache[repo_full_name] = (repo_fields, repository_id)
         
     except Exception as e:
         logger.error(f"Error handling push event: {str(e)}")
+        await db.rollback()
+        raise
 
-async def _handle_repository_event(payload: Dict[str, Any], background_tasks: BackgroundTasks, db: Session):
+async def _handle_repository_event(payload: WebhookPayload, db: AsyncSession):
     """Handle repository webhook events"""
     
     try:
-        action = payload.get("action")
-        repo_data = payload.get("repository", {})
+        action = payload.action
+        repo_data = payload.repository or {}
         
         if action == "created":
             # New repository added
@@ -188,24 +422,27 @@ async def _handle_repository_event(payload: Dict[str, Any], background_tasks: Ba
                 url=repo_data.get("html_url")
             )
             db.add(repository)
-            db.commit()
+            await db.commit()
             
-            logger.info(f"Added new repository: {repo_data.get('full_name')}")
+            logger.info("Added new repository: %s", repo_data.get("full_name"))
         
         elif action == "deleted":
             # Repository deleted
-            repository = db.query(Repository).filter(
-                Repository.full_name == repo_data.get("full_name")
-            ).first()
+            _repo_id_cache.pop(repo_data.get("full_name"), None)
+            repository = await db.scalar(
+                select(Repository).where(Repository.full_name == repo_data.get("full_name"))
+            )
             
             if repository:
                 repository.is_active = False
-                db.commit()
+                await db.commit()
                 
-                logger.info(f"Deactivated repository: {repo_data.get('full_name')}")
+                logger.info("Deactivated repository: %s", repo_data.get("full_name"))
         
     except Exception as e:
         logger.error(f"Error handling repository event: {str(e)}")
+        await db.rollback()
+        raise
 
 async def _trigger_code_analysis(
     repository_id: int,
@@ -224,21 +461,22 @@ async def _trigger_code_analysis(
         files = await github_service.get_pull_request_files(owner, repo_name, pr_number)
         
         if not files:
-            logger.warning(f"No files found for PR {owner}/{repo_name}#{pr_number}")
+            logger.warning("No files found for PR %s/%s#%s", owner, repo_name, pr_number)
             return
         
         # Prepare file information
-        file_info = []
-        for file in files:
-            if file["status"] in ["added", "modified"]:
-                file_info.append({
-                    "path": file["filename"],
-                    "language": _detect_language(file["filename"]),
-                    "changed_lines": _extract_changed_lines(file.get("patch", ""))
-                })
+        file_info = [
+            {
+                "path": file["filename"],
+                "language": _detect_language(file["filename"]),
+                "changed_lines": _extract_changed_lines(file.get("patch", ""))
+            }
+            for file in files
+            if file["status"] in _ANALYZED_STATUSES
+        ]
         
         if not file_info:
-            logger.info(f"No relevant files to analyze for PR {owner}/{repo_name}#{pr_number}")
+            logger.info("No relevant files to analyze for PR %s/%s#%s", owner, repo_name, pr_number)
             return
         
         # Import here to avoid circular imports
@@ -259,7 +497,7 @@ async def _trigger_code_analysis(
         )
         
         # Start analysis (this would normally be done through the API)
-        logger.info(f"Starting code analysis for PR {owner}/{repo_name}#{pr_number}")
+        logger.info("Starting code analysis for PR %s/%s#%s", owner, repo_name, pr_number)
         
     except Exception as e:
         logger.error(f"Error triggering code analysis: {str(e)}")
@@ -267,63 +505,30 @@ async def _trigger_code_analysis(
 def _detect_language(filename: str) -> str:
     """Detect programming language from filename"""
     
-    extensions = {
-        '.py': 'python',
-        '.js': 'javascript',
-        '.ts': 'typescript',
-        '.jsx': 'javascript',
-        '.tsx': 'typescript',
-        '.java': 'java',
-        '.cpp': 'cpp',
-        '.c': 'c',
-        '.h': 'c',
-        '.go': 'go',
-        '.rs': 'rust',
-        '.php': 'php',
-        '.rb': 'ruby',
-        '.swift': 'swift',
-        '.kt': 'kotlin',
-        '.scala': 'scala',
-        '.sh': 'shell',
-        '.sql': 'sql',
-        '.html': 'html',
-        '.css': 'css',
-        '.scss': 'scss',
-        '.sass': 'sass',
-        '.xml': 'xml',
-        '.yaml': 'yaml',
-        '.yml': 'yaml',
-        '.json': 'json',
-        '.md': 'markdown',
-        '.txt': 'text'
-    }
-    
-    for ext, lang in extensions.items():
-        if filename.lower().endswith(ext):
-            return lang
+    dot = filename.rfind('.')
+    if dot == -1:
+        return 'unknown'
     
-    return 'unknown'
+    return _EXT_TO_LANG.get(filename[dot:].lower(), 'unknown')
 
 def _extract_changed_lines(patch: str) -> list:
     """Extract changed line numbers from git patch"""
     
-    changed_lines = []
-    
     if not patch:
-        return changed_lines
+        return []
     
-    lines = patch.split('\n')
-    for line in lines:
+    # Walk each hunk, tracking the new-file line number of every added line
+    changed_lines = []
+    line_number = 0
+    for line in patch.split('\n'):
         if line.startswith('@@'):
-            # Parse hunk header
-            parts = line.split(' ')
-            if len(parts) >= 3:
-                line_info = parts[2]
-                if line_info.startswith('+'):
-                    try:
-                        start_line = int(line_info.split(',')[0][1:])
-                        changed_lines.append(start_line)
-                    except (ValueError, IndexError):
-                        continue
+            match = _HUNK_RE.match(line)
+            if match:
+                line_number = int(match.group(1))
+        elif line.startswith('+'):
+            changed_lines.append(line_number)
+            line_number += 1
+        elif not line.startswith(('-', '\\')):
+            line_number += 1
     
     return changed_lines
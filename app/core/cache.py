@@ -0,0 +1,9 @@
+"""
+Shared cache clients
+"""
+
+import redis.asyncio as redis
+from app.core.config import settings
+
+# Shared Redis client, None when REDIS_URL is not configured
+redis_client = redis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
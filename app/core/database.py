@@ -2,7 +2,9 @@
 Database configuration and models
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, JSON, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, JSON, ForeignKey, Index, LargeBinary, UniqueConstraint
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.sql import func
@@ -13,11 +15,47 @@ import os
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./codesense_ai.db")
 
 # Create engine
-engine = create_engine(DATABASE_URL)
+if DATABASE_URL.startswith("sqlite"):
+    # SQLite connections are shared with FastAPI's threadpool workers
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False}
+    )
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_database_url(url: str):
+    """Map a sync database URL onto its async driver"""
+    url = make_url(url)
+    drivers = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+    driver = drivers.get(url.get_backend_name())
+    return url.set(drivername=driver) if driver else url
+
+# Async engine for handlers that run on the event loop (webhooks); it only serves
+# the webhook path, so its pool is kept small to bound connections per worker
+if DATABASE_URL.startswith("sqlite"):
+    async_engine = create_async_engine(_async_database_url(DATABASE_URL))
+else:
+    async_engine = create_async_engine(
+        _async_database_url(DATABASE_URL),
+        pool_size=int(os.getenv("DB_ASYNC_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "5")),
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
+
+# Async session factory
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
@@ -30,6 +68,15 @@ def get_db():
     finally:
         db.close()
 
+def init_db():
+    """Create database tables; run once per deployment, before workers start"""
+    Base.metadata.create_all(bind=engine)
+
+async def get_async_db():
+    """Get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Models
 class Repository(Base):
     """Repository model"""
@@ -48,6 +95,7 @@ class Repository(Base):
     # Relationships
     pull_requests = relationship("PullRequest", back_populates="repository")
     reviews = relationship("CodeReview", back_populates="repository")
+    commits = relationship("Commit", back_populates="repository")
 
 class PullRequest(Base):
     """Pull Request model"""
@@ -70,6 +118,25 @@ class PullRequest(Base):
     repository = relationship("Repository", back_populates="pull_requests")
     reviews = relationship("CodeReview", back_populates="pull_request")
 
+class Commit(Base):
+    """Commit model for pushed commits"""
+    __tablename__ = "commits"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    repository_id = Column(Integer, ForeignKey("repositories.id"), index=True)
+    sha = Column(String, index=True)
+    author = Column(String)
+    message = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    repository = relationship("Repository", back_populates="commits")
+    
+    # A SHA is only unique within a repository; forks share history with upstream
+    __table_args__ = (
+        UniqueConstraint("repository_id", "sha", name="uq_commits_repository_sha"),
+    )
+
 class CodeReview(Base):
     """Code Review model"""
     __tablename__ = "code_reviews"
@@ -86,13 +153,19 @@ class CodeReview(Base):
     suggestion = Column(Text)
     ai_confidence = Column(Integer)  # 0-100
     status = Column(String, default="open")  # open, resolved, dismissed
-    metadata = Column(JSON)  # Additional data
+    meta = Column("metadata", JSON)  # Additional data; "metadata" is reserved on declarative models
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     repository = relationship("Repository", back_populates="reviews")
     pull_request = relationship("PullRequest", back_populates="reviews")
+    
+    # Indexes for dashboard and session result queries
+    __table_args__ = (
+        Index("ix_cr_repo_pr_status", "repository_id", "pull_request_id", "status"),
+        Index("ix_reviews_created_at", "created_at"),
+    )
 
 class ReviewSession(Base):
     """Review Session model for tracking analysis runs"""
@@ -109,8 +182,23 @@ class ReviewSession(Base):
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True))
     error_message = Column(Text)
-    metadata = Column(JSON)
+    meta = Column("metadata", JSON)
     
     # Relationships
     repository = relationship("Repository")
     pull_request = relationship("PullRequest")
+
+class WebhookInbox(Base):
+    """Webhook inbox model for deliveries accepted but not yet processed"""
+    __tablename__ = "webhook_inbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    delivery_id = Column(String, unique=True, index=True)
+    event_type = Column(String)
+    body = Column(LargeBinary)  # Raw payload bytes as signed by GitHub
+    status = Column(String, default="pending")  # pending, processed, failed
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True))
+
+if __name__ == "__main__":
+    init_db()
@@ -2,12 +2,30 @@
 Logging configuration
 """
 
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 from app.core.config import settings
 
+# Background listener that writes queued log records to the real handlers
+_queue_listener = None
+
+def _stop_listener():
+    """Flush and stop the current queue listener"""
+    global _queue_listener
+    
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+# Registered once; setup_logging replaces the listener this stops
+atexit.register(_stop_listener)
+
 def setup_logging():
     """Setup logging configuration"""
+    global _queue_listener
     
     # Log level based on environment
     log_level = logging.DEBUG if settings.DEBUG else logging.INFO
@@ -25,18 +43,29 @@ def setup_logging():
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
     
+    # Stop a listener left over from a previous setup
+    _stop_listener()
+    
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(log_level)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # File handler for production
     if settings.ENVIRONMENT == "production":
         file_handler = logging.FileHandler("codesense_ai.log")
         file_handler.setLevel(log_level)
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    
+    # Callers format the message and enqueue the record; handler I/O happens on the listener thread
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _queue_listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _queue_listener.start()
     
     # Set specific logger levels
     logging.getLogger("uvicorn").setLevel(logging.INFO)
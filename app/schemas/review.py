@@ -40,6 +40,7 @@ class ReviewRequest(BaseModel):
     head_sha: str = Field(..., description="Head commit SHA")
     base_sha: str = Field(..., description="Base commit SHA")
     files: List[FileInfo] = Field(..., description="Files to analyze")
+    deep: bool = Field(False, description="Run separate bug, security and quality analyses per file")
 
 class CodeReviewItem(BaseModel):
     """Individual code review item"""
@@ -75,13 +76,6 @@ class AnalysisResult(BaseModel):
     static_analysis: Dict[str, Any]
     timestamp: str
 
-class WebhookPayload(BaseModel):
-    """GitHub webhook payload model"""
-    action: str
-    pull_request: Optional[Dict[str, Any]] = None
-    repository: Optional[Dict[str, Any]] = None
-    sender: Optional[Dict[str, Any]] = None
-
 class RepositoryInfo(BaseModel):
     """Repository information model"""
     id: int
@@ -2,12 +2,13 @@
 Webhook schemas
 """
 
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+import msgspec
+from typing import Optional, Dict, Any, List
 
-class WebhookPayload(BaseModel):
-    """GitHub webhook payload model"""
-    action: str
+class WebhookPayload(msgspec.Struct):
+    """GitHub webhook payload model, decoded straight from the request body"""
+    action: Optional[str] = None
     pull_request: Optional[Dict[str, Any]] = None
     repository: Optional[Dict[str, Any]] = None
     sender: Optional[Dict[str, Any]] = None
+    commits: List[Dict[str, Any]] = msgspec.field(default_factory=list)
@@ -5,28 +5,248 @@ LangChain-powered AI Code Analysis Service
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage, SystemMessage
-from langchain.memory import ConversationBufferMemory
 from langchain.chains import LLMChain
-from typing import List, Dict, Any, Optional
-import json
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from cachetools import TTLCache
+from functools import lru_cache, wraps
+from itertools import groupby
+import ast
+import asyncio
+import hashlib
 import logging
+import orjson
+import tiktoken
+from app.core.cache import redis_client
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=1)
+def _get_encoding() -> tiktoken.Encoding:
+    """Get the tokenizer for the configured model"""
+    try:
+        return tiktoken.encoding_for_model(settings.DEFAULT_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def _count_tokens(text: str) -> int:
+    """Count tokens in text for the configured model"""
+    return len(_get_encoding().encode(text))
+
+_MAX_CHANGED_LINES = 200
+
+def _ranges(lines: List[int]) -> str:
+    """Collapse line numbers into compact ranges such as 34-67, 89, 102-110"""
+    unique = sorted(set(lines))
+    if not unique:
+        return "none"
+    
+    omitted = max(len(unique) - _MAX_CHANGED_LINES, 0)
+    parts = []
+    for _, group in groupby(enumerate(unique[:_MAX_CHANGED_LINES]), lambda pair: pair[1] - pair[0]):
+        run = [line for _, line in group]
+        parts.append(str(run[0]) if len(run) == 1 else f"{run[0]}-{run[-1]}")
+    
+    text = ", ".join(parts)
+    return f"{text} ... (+{omitted} more)" if omitted else text
+
+_TRIM_THRESHOLD_CHARS = 4000
+
+def _trim_code(code: str, changed_lines: List[int], context: int = 5) -> str:
+    """Keep only changed lines and their surrounding context from large files"""
+    if len(code) <= _TRIM_THRESHOLD_CHARS or not changed_lines:
+        return code
+    
+    lines = code.split("\n")
+    keep = [False] * len(lines)
+    for changed in changed_lines:
+        for index in range(max(changed - 1 - context, 0), min(changed + context, len(lines))):
+            keep[index] = True
+    if not any(keep):
+        return code
+    
+    # Kept lines carry their file line number, which the system prompt asks the model to report
+    trimmed = []
+    index = 0
+    while index < len(lines):
+        if keep[index]:
+            trimmed.append(f"{index + 1:>5}| {lines[index]}")
+            index += 1
+            continue
+        start = index
+        while index < len(lines) and not keep[index]:
+            index += 1
+        trimmed.append(f"... (lines {start + 1}-{index} omitted) ...")
+    
+    return "\n".join(trimmed)
+
+_CHUNK_LINES = 200
+
+def _split_by_ast(code: str, language: str) -> List[Tuple[int, str]]:
+    """Split code into chunks within the input token budget, as (first line number, text)"""
+    lines = code.split("\n")
+    
+    # Cut at top-level definitions for Python, fixed line windows otherwise
+    boundaries = None
+    if language.lower() in ('python', 'py'):
+        try:
+            tree = ast.parse(code)
+            boundaries = sorted({0, *(
+                min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])]) - 1
+                for node in tree.body
+            )})
+        except SyntaxError:
+            pass
+    if boundaries is None:
+        boundaries = list(range(0, len(lines), _CHUNK_LINES))
+    
+    def _fit(start: int, end: int) -> List[Tuple[int, int]]:
+        # Halve an oversized segment until every piece fits; a lone line is kept as is
+        if end - start <= 1 or _count_tokens("\n".join(lines[start:end])) <= settings.MAX_INPUT_TOKENS:
+            return [(start, end)]
+        middle = (start + end) // 2
+        return _fit(start, middle) + _fit(middle, end)
+    
+    segments = []
+    for start, end in zip(boundaries, boundaries[1:] + [len(lines)]):
+        segments.extend(_fit(start, end))
+    
+    # Pack neighbouring segments together while they fit the budget
+    chunks = []
+    chunk_start, chunk_end = segments[0]
+    for start, end in segments[1:]:
+        if _count_tokens("\n".join(lines[chunk_start:end])) <= settings.MAX_INPUT_TOKENS:
+            chunk_end = end
+        else:
+            chunks.append((chunk_start + 1, "\n".join(lines[chunk_start:chunk_end])))
+            chunk_start, chunk_end = start, end
+    chunks.append((chunk_start + 1, "\n".join(lines[chunk_start:chunk_end])))
+    
+    return chunks
+
+# Per-analysis focus lists shared by the dedicated, unified and batch prompts
+_BUG_FOCUS = """- Logic errors
+- Edge cases
+- Null pointer exceptions
+- Array bounds issues
+- Race conditions
+- Memory leaks"""
+
+_SECURITY_FOCUS = """- SQL injection
+- XSS vulnerabilities
+- Authentication bypass
+- Authorization issues
+- Input validation
+- Secret exposure
+- Insecure dependencies"""
+
+_QUALITY_FOCUS = """- Code complexity
+- Naming conventions
+- Code duplication
+- Error handling
+- Documentation
+- Test coverage
+- Design patterns"""
+
+# Variable part of the prompts, kept last so the static prefix stays identical
+_FILE_MESSAGE = """Context:
+- Repository: {repository_name}
+- Pull Request: {pr_title}
+- Changed lines: {changed_lines}
+
+File: {file_path}
+Language: {language}
+Code:
+```{language}
+{code}
+```"""
+
+_BATCH_MESSAGE = """Context:
+- Repository: {repository_name}
+- Pull Request: {pr_title}
+
+{files}"""
+
+# Caps in-flight LLM requests across all analyses in this process
+_llm_semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+# Parsed analysis results keyed by prompt, context and model
+_analysis_cache: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+_ANALYSIS_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+async def _get_cached_analysis(key: str) -> Optional[Dict[str, Any]]:
+    """Look up a cached analysis result in process, then in Redis"""
+    result = _analysis_cache.get(key)
+    if result is not None or redis_client is None:
+        return result
+    
+    try:
+        cached = await redis_client.get(key)
+    except Exception as e:
+        logger.warning(f"Redis analysis cache lookup failed: {str(e)}")
+        return None
+    
+    if cached is None:
+        return None
+    result = orjson.loads(cached)
+    _analysis_cache[key] = result
+    return result
+
+async def _set_cached_analysis(key: str, result: Dict[str, Any]):
+    """Store an analysis result in process and in Redis"""
+    _analysis_cache[key] = result
+    if redis_client is None:
+        return
+    
+    try:
+        await redis_client.setex(key, _ANALYSIS_CACHE_TTL_SECONDS, orjson.dumps(result))
+    except Exception as e:
+        logger.warning(f"Redis analysis cache store failed: {str(e)}")
+
+def _cached_analysis(func):
+    """Cache successful analysis results so identical prompts skip the LLM call"""
+    
+    @wraps(func)
+    async def wrapper(self, chain: LLMChain, context: Dict[str, Any]) -> Dict[str, Any]:
+        key = "analysis:" + hashlib.sha256(
+            b"|".join((
+                repr(chain.prompt).encode(),
+                orjson.dumps(context, option=orjson.OPT_SORT_KEYS, default=str),
+                chain.llm.model_name.encode()
+            ))
+        ).hexdigest()
+        
+        cached = await _get_cached_analysis(key)
+        if cached is not None:
+            return cached
+        
+        result = await func(self, chain, context)
+        if "error" not in result and "raw_response" not in result:
+            await _set_cached_analysis(key, result)
+        return result
+    
+    return wrapper
+
 class CodeAnalysisService:
     """AI-powered code analysis using LangChain"""
     
     def __init__(self):
         """Initialize the code analysis service"""
-        self.llm = ChatOpenAI(
-            model=settings.DEFAULT_MODEL,
+        self.llm = self._create_llm(settings.DEFAULT_MODEL)
+        self.llm_small = self._create_llm(settings.SMALL_MODEL)
+        self._setup_prompts()
+    
+    def _create_llm(self, model: str) -> ChatOpenAI:
+        """Create a chat model client for the given model name"""
+        return ChatOpenAI(
+            model=model,
             temperature=settings.TEMPERATURE,
             max_tokens=settings.MAX_TOKENS,
-            openai_api_key=settings.OPENAI_API_KEY
+            openai_api_key=settings.OPENAI_API_KEY,
+            model_kwargs=(
+                {"response_format": {"type": "json_object"}} if settings.LLM_JSON_MODE else {}
+            )
         )
-        self.memory = ConversationBufferMemory()
-        self._setup_prompts()
     
     def _setup_prompts(self):
         """Setup LangChain prompts for different analysis types"""
@@ -46,137 +266,191 @@ Analyze the provided code and identify:
 4. Potential bugs
 5. Improvement suggestions
 
-Provide specific, actionable feedback with code examples when possible."""
-
-        # Bug detection prompt
-        self.bug_detection_prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=self.system_prompt),
-            HumanMessage(content="""
-Analyze this code for potential bugs and issues:
+Provide specific, actionable feedback with code examples when possible.
 
-File: {file_path}
-Language: {language}
-Code:
-```{language}
-{code}
-```
+When code lines are prefixed with a line number and "| ", that number is the line in the original file; use it as the "line" of any finding on that code."""
 
-Context:
-- Repository: {repository_name}
-- Pull Request: {pr_title}
-- Changed lines: {changed_lines}
+        # Static instructions live in the system message and per-file content comes last,
+        # so every request shares a long identical prefix for provider-side prompt caching
+        
+        # Bug detection prompt
+        self.bug_detection_prompt = self._build_file_prompt("""Analyze the code for potential bugs and issues.
 
 Focus on:
-- Logic errors
-- Edge cases
-- Null pointer exceptions
-- Array bounds issues
-- Race conditions
-- Memory leaks
+""" + _BUG_FOCUS + """
 
 Return your analysis in JSON format:
-{{
+{
     "bugs": [
-        {{
+        {
             "line": 42,
             "type": "null_pointer",
             "severity": "high",
             "title": "Potential null pointer exception",
             "description": "Variable 'user' could be null when accessing 'user.name'",
-            "suggestion": "Add null check: if (user != null) {{ return user.name; }}"
-        }}
+            "suggestion": "Add null check: if (user != null) { return user.name; }"
+        }
     ],
     "confidence": 85
-}}
-""")
-        ])
+}""")
         
         # Security analysis prompt
-        self.security_prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=self.system_prompt),
-            HumanMessage(content="""
-Analyze this code for security vulnerabilities:
-
-File: {file_path}
-Language: {language}
-Code:
-```{language}
-{code}
-```
-
-Context:
-- Repository: {repository_name}
-- Pull Request: {pr_title}
-- Changed lines: {changed_lines}
+        self.security_prompt = self._build_file_prompt("""Analyze the code for security vulnerabilities.
 
 Focus on:
-- SQL injection
-- XSS vulnerabilities
-- Authentication bypass
-- Authorization issues
-- Input validation
-- Secret exposure
-- Insecure dependencies
+""" + _SECURITY_FOCUS + """
 
 Return your analysis in JSON format:
-{{
+{
     "security_issues": [
-        {{
+        {
             "line": 15,
             "type": "sql_injection",
             "severity": "critical",
             "title": "SQL Injection vulnerability",
             "description": "User input directly concatenated into SQL query",
             "suggestion": "Use parameterized queries or prepared statements"
-        }}
+        }
     ],
     "confidence": 95
-}}
-""")
-        ])
+}""")
         
         # Code quality prompt
-        self.quality_prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=self.system_prompt),
-            HumanMessage(content="""
-Analyze this code for quality and maintainability issues:
-
-File: {file_path}
-Language: {language}
-Code:
-```{language}
-{code}
-```
-
-Context:
-- Repository: {repository_name}
-- Pull Request: {pr_title}
-- Changed lines: {changed_lines}
+        self.quality_prompt = self._build_file_prompt("""Analyze the code for quality and maintainability issues.
 
 Focus on:
-- Code complexity
-- Naming conventions
-- Code duplication
-- Error handling
-- Documentation
-- Test coverage
-- Design patterns
+""" + _QUALITY_FOCUS + """
 
 Return your analysis in JSON format:
-{{
+{
     "quality_issues": [
-        {{
+        {
             "line": 30,
             "type": "complexity",
             "severity": "medium",
             "title": "High cyclomatic complexity",
             "description": "Function has too many conditional branches",
             "suggestion": "Consider breaking into smaller functions"
-        }}
+        }
     ],
     "confidence": 75
-}}
-""")
+}""")
+        
+        # Unified prompt: bugs, security and quality in a single call
+        self.unified_prompt = self._build_file_prompt("""Analyze the code for bugs, security vulnerabilities, and quality issues.
+
+## Bugs
+Focus on:
+""" + _BUG_FOCUS + """
+
+## Security
+Focus on:
+""" + _SECURITY_FOCUS + """
+
+## Quality
+Focus on:
+""" + _QUALITY_FOCUS + """
+
+Return your analysis in JSON format, using an empty list for any section with no findings:
+{
+    "bugs": [
+        {
+            "line": 42,
+            "type": "null_pointer",
+            "severity": "high",
+            "title": "Potential null pointer exception",
+            "description": "Variable 'user' could be null when accessing 'user.name'",
+            "suggestion": "Add null check: if (user != null) { return user.name; }"
+        }
+    ],
+    "security_issues": [
+        {
+            "line": 15,
+            "type": "sql_injection",
+            "severity": "critical",
+            "title": "SQL Injection vulnerability",
+            "description": "User input directly concatenated into SQL query",
+            "suggestion": "Use parameterized queries or prepared statements"
+        }
+    ],
+    "quality_issues": [
+        {
+            "line": 30,
+            "type": "complexity",
+            "severity": "medium",
+            "title": "High cyclomatic complexity",
+            "description": "Function has too many conditional branches",
+            "suggestion": "Consider breaking into smaller functions"
+        }
+    ],
+    "confidence": {
+        "bugs": 85,
+        "security": 95,
+        "quality": 75
+    }
+}""")
+        
+        # Batch prompt: the unified first pass for several small files in one call
+        self.unified_batch_prompt = self._build_batch_prompt("""Analyze each file in the request for bugs, security vulnerabilities, and quality issues.
+
+## Bugs
+Focus on:
+""" + _BUG_FOCUS + """
+
+## Security
+Focus on:
+""" + _SECURITY_FOCUS + """
+
+## Quality
+Focus on:
+""" + _QUALITY_FOCUS + """
+
+Return one JSON object with an entry for every file, using the FILE number as file_index and an empty list for any section with no findings:
+{
+    "results": [
+        {
+            "file_index": 0,
+            "bugs": [
+                {
+                    "line": 42,
+                    "type": "null_pointer",
+                    "severity": "high",
+                    "title": "Potential null pointer exception",
+                    "description": "Variable 'user' could be null when accessing 'user.name'",
+                    "suggestion": "Add null check: if (user != null) { return user.name; }"
+                }
+            ],
+            "security_issues": [],
+            "quality_issues": [],
+            "confidence": {
+                "bugs": 85,
+                "security": 95,
+                "quality": 75
+            }
+        }
+    ]
+}""")
+        
+        # Chains are built once and reused for every analyzed file; the unified
+        # first passes run on the small model and the dedicated chains on the default one
+        self.unified_chain = LLMChain(llm=self.llm_small, prompt=self.unified_prompt)
+        self.unified_batch_chain = LLMChain(llm=self.llm_small, prompt=self.unified_batch_prompt)
+        self.bug_chain = LLMChain(llm=self.llm, prompt=self.bug_detection_prompt)
+        self.security_chain = LLMChain(llm=self.llm, prompt=self.security_prompt)
+        self.quality_chain = LLMChain(llm=self.llm, prompt=self.quality_prompt)
+    
+    def _build_file_prompt(self, instructions: str) -> ChatPromptTemplate:
+        """Build a per-file prompt with static instructions ahead of the file content"""
+        return ChatPromptTemplate.from_messages([
+            SystemMessage(content=f"{self.system_prompt}\n\n{instructions}"),
+            ("human", _FILE_MESSAGE)
+        ])
+    
+    def _build_batch_prompt(self, instructions: str) -> ChatPromptTemplate:
+        """Build a prompt that analyzes several delimited files in one call"""
+        return ChatPromptTemplate.from_messages([
+            SystemMessage(content=f"{self.system_prompt}\n\n{instructions}"),
+            ("human", _BATCH_MESSAGE)
         ])
     
     async def analyze_code(self, 
@@ -185,68 +459,275 @@ Return your analysis in JSON format:
                           language: str,
                           repository_name: str,
                           pr_title: str,
-                          changed_lines: List[int]) -> Dict[str, Any]:
+                          changed_lines: List[int],
+                          deep: bool = False,
+                          first_pass: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Analyze code for bugs, security issues, and quality problems"""
         
         try:
             logger.info(f"Analyzing code in {file_path}")
             
-            # Prepare context
-            context = {
-                "file_path": file_path,
-                "language": language,
-                "code": code,
-                "repository_name": repository_name,
-                "pr_title": pr_title,
-                "changed_lines": changed_lines
-            }
+            prompt_code = _trim_code(code, changed_lines)
             
-            # Run different analysis types
-            bug_analysis = await self._run_analysis(self.bug_detection_prompt, context)
-            security_analysis = await self._run_analysis(self.security_prompt, context)
-            quality_analysis = await self._run_analysis(self.quality_prompt, context)
+            # Files over the input budget would be truncated or fail, so analyze them in chunks
+            if _count_tokens(prompt_code) > settings.MAX_INPUT_TOKENS:
+                results = await self._analyze_chunks(
+                    code, file_path, language, repository_name, pr_title, changed_lines, deep
+                )
+            else:
+                # Prepare context
+                context = {
+                    "file_path": file_path,
+                    "language": language,
+                    "code": prompt_code,
+                    "repository_name": repository_name,
+                    "pr_title": pr_title,
+                    "changed_lines": _ranges(changed_lines)
+                }
+                results = await self._analyze_context(context, deep, first_pass)
             
-            # Combine results
-            results = {
-                "file_path": file_path,
-                "language": language,
-                "bugs": bug_analysis.get("bugs", []),
-                "security_issues": security_analysis.get("security_issues", []),
-                "quality_issues": quality_analysis.get("quality_issues", []),
-                "overall_confidence": self._calculate_overall_confidence([
-                    bug_analysis.get("confidence", 0),
-                    security_analysis.get("confidence", 0),
-                    quality_analysis.get("confidence", 0)
-                ])
-            }
+            results = {"file_path": file_path, "language": language, **results}
             
             logger.info(f"Analysis completed for {file_path}")
             return results
             
         except Exception as e:
             logger.error(f"Error analyzing code in {file_path}: {str(e)}")
-            return {
-                "file_path": file_path,
+            return self._failed_result(file_path, language, e)
+    
+    def _failed_result(self, file_path: str, language: str, error: Exception) -> Dict[str, Any]:
+        """Result for a file whose analysis raised"""
+        return {
+            "file_path": file_path,
+            "language": language,
+            "bugs": [],
+            "security_issues": [],
+            "quality_issues": [],
+            "error": str(error)
+        }
+    
+    async def _analyze_context(self,
+                               context: Dict[str, Any],
+                               deep: bool,
+                               first_pass: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Analyze one prompt-sized piece of code, reusing a first pass already run in a batch"""
+        
+        # Deep mode runs the dedicated prompts; otherwise one unified call covers all three
+        if deep:
+            return await self._run_deep_analysis(context)
+        
+        analysis = first_pass if first_pass is not None else await self._run_analysis(self.unified_chain, context)
+        confidence = analysis.get("confidence", 0)
+        if not isinstance(confidence, dict):
+            confidence = {"bugs": confidence, "security": confidence, "quality": confidence}
+        results = {
+            "bugs": analysis.get("bugs", []),
+            "security_issues": analysis.get("security_issues", []),
+            "quality_issues": analysis.get("quality_issues", []),
+            "overall_confidence": self._calculate_overall_confidence([
+                confidence.get("bugs", 0),
+                confidence.get("security", 0),
+                confidence.get("quality", 0)
+            ]),
+            "model_used": settings.SMALL_MODEL
+        }
+        
+        # A failed first pass must not read as a clean file
+        if "error" in analysis:
+            results["error"] = analysis["error"]
+        
+        # Escalate to the default model only when the first pass is unsure or flags security risk
+        if (results["overall_confidence"] < settings.ESCALATION_CONFIDENCE_THRESHOLD
+                or results["security_issues"]):
+            logger.info(f"Escalating security analysis of {context['file_path']} to {settings.DEFAULT_MODEL}")
+            security_analysis = await self._run_analysis(self.security_chain, context)
+            if "error" not in security_analysis and "raw_response" not in security_analysis:
+                results["security_issues"] = security_analysis.get("security_issues", [])
+                results["model_used"] = settings.DEFAULT_MODEL
+        
+        return results
+    
+    async def _analyze_chunks(self,
+                              code: str,
+                              file_path: str,
+                              language: str,
+                              repository_name: str,
+                              pr_title: str,
+                              changed_lines: List[int],
+                              deep: bool) -> Dict[str, Any]:
+        """Analyze an oversized file chunk by chunk and merge the findings"""
+        
+        offsets = []
+        analyses = []
+        for first_line, chunk in _split_by_ast(code, language):
+            last_line = first_line + chunk.count("\n")
+            chunk_changed = [line - first_line + 1 for line in changed_lines if first_line <= line <= last_line]
+            if changed_lines and not chunk_changed:
+                continue
+            
+            offsets.append(first_line - 1)
+            analyses.append(self._analyze_context({
+                "file_path": f"{file_path} (lines {first_line}-{last_line})",
                 "language": language,
-                "bugs": [],
-                "security_issues": [],
-                "quality_issues": [],
-                "error": str(e)
-            }
+                "code": chunk,
+                "repository_name": repository_name,
+                "pr_title": pr_title,
+                "changed_lines": _ranges(chunk_changed)
+            }, deep))
+        
+        logger.info(f"Split {file_path} into {len(analyses)} chunks for analysis")
+        chunk_results = await asyncio.gather(*analyses)
+        
+        # Chunk-relative line numbers are shifted back to file line numbers
+        results = {"bugs": [], "security_issues": [], "quality_issues": []}
+        for offset, chunk_result in zip(offsets, chunk_results):
+            for key, issues in results.items():
+                for issue in chunk_result.get(key, []):
+                    if isinstance(issue, dict) and isinstance(issue.get("line"), int):
+                        issue = {**issue, "line": issue["line"] + offset}
+                    issues.append(issue)
+        
+        results["overall_confidence"] = self._calculate_overall_confidence([
+            chunk_result.get("overall_confidence", 0) for chunk_result in chunk_results
+        ])
+        results["model_used"] = (
+            settings.DEFAULT_MODEL
+            if any(chunk_result.get("model_used") == settings.DEFAULT_MODEL for chunk_result in chunk_results)
+            else settings.SMALL_MODEL
+        )
+        errors = [chunk_result["error"] for chunk_result in chunk_results if "error" in chunk_result]
+        if errors:
+            results["error"] = errors[0]
+        return results
+    
+    async def analyze_pr(self,
+                         files: List[Dict[str, Any]],
+                         repository_name: str,
+                         pr_title: str,
+                         deep: bool = False) -> List[Dict[str, Any]]:
+        """Analyze all files of a pull request concurrently, in input order"""
+        
+        semaphore = asyncio.Semaphore(settings.ANALYSIS_CONCURRENCY)
+        
+        async def _analyze_group(group: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                if len(group) > 1:
+                    return await self._analyze_batch(group, repository_name, pr_title)
+                return [await self.analyze_code(repository_name=repository_name, pr_title=pr_title, deep=deep, **group[0])]
+        
+        # Deep mode keeps its per-file prompts; otherwise small files share first-pass calls
+        groups = [[file] for file in files] if deep else self._group_files(files)
+        group_results = await asyncio.gather(*(_analyze_group(group) for group in groups), return_exceptions=True)
+        
+        # A group that raised is reported per file instead of failing the whole PR
+        results = []
+        for group, group_result in zip(groups, group_results):
+            if isinstance(group_result, Exception):
+                logger.error(f"Error analyzing batch of {len(group)} files: {str(group_result)}")
+                group_result = [self._failed_result(file["file_path"], file["language"], group_result) for file in group]
+            results.extend(group_result)
+        return results
+    
+    def _group_files(self, files: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Group consecutive small files into batches that fit one first-pass prompt"""
+        
+        groups = []
+        batch = []
+        batch_tokens = 0
+        for file in files:
+            tokens = _count_tokens(_trim_code(file["code"], file["changed_lines"]))
+            if batch and (len(batch) >= settings.ANALYSIS_BATCH_SIZE
+                          or batch_tokens + tokens > settings.MAX_INPUT_TOKENS):
+                groups.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(file)
+            batch_tokens += tokens
+        if batch:
+            groups.append(batch)
+        
+        return groups
+    
+    async def _analyze_batch(self,
+                             batch: List[Dict[str, Any]],
+                             repository_name: str,
+                             pr_title: str) -> List[Dict[str, Any]]:
+        """Run one first pass for a batch of files, then finish each file on its own"""
+        
+        analysis = await self._run_analysis(self.unified_batch_chain, {
+            "files": self._format_batch_files(batch),
+            "repository_name": repository_name,
+            "pr_title": pr_title
+        })
+        entries = analysis.get("results")
+        first_passes = {
+            entry["file_index"]: entry
+            for entry in (entries if isinstance(entries, list) else [])
+            if isinstance(entry, dict) and isinstance(entry.get("file_index"), int)
+        }
+        if len(first_passes) < len(batch):
+            logger.warning("Batch analysis response could not be split per file, analyzing the rest individually")
+        
+        # Files missing from the response fall back to their own first pass
+        return list(await asyncio.gather(*(
+            self.analyze_code(
+                repository_name=repository_name,
+                pr_title=pr_title,
+                first_pass=first_passes.get(index),
+                **file
+            )
+            for index, file in enumerate(batch)
+        )))
+    
+    def _format_batch_files(self, files: List[Dict[str, Any]]) -> str:
+        """Render files as numbered, delimited sections for a batch prompt"""
+        sections = []
+        for index, file in enumerate(files):
+            sections.append(
+                f"### FILE {index}: {file['file_path']}\n"
+                f"Language: {file['language']}\n"
+                f"Changed lines: {_ranges(file['changed_lines'])}\n"
+                f"```{file['language']}\n{_trim_code(file['code'], file['changed_lines'])}\n```"
+            )
+        return "\n\n".join(sections)
+    
+    async def _run_deep_analysis(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the dedicated bug, security and quality analyses concurrently"""
+        
+        analyses = await asyncio.gather(
+            self._run_analysis(self.bug_chain, context),
+            self._run_analysis(self.security_chain, context),
+            self._run_analysis(self.quality_chain, context),
+            return_exceptions=True
+        )
+        bug_analysis, security_analysis, quality_analysis = [
+            {"error": str(analysis), "confidence": 0} if isinstance(analysis, Exception) else analysis
+            for analysis in analyses
+        ]
+        
+        return {
+            "bugs": bug_analysis.get("bugs", []),
+            "security_issues": security_analysis.get("security_issues", []),
+            "quality_issues": quality_analysis.get("quality_issues", []),
+            "overall_confidence": self._calculate_overall_confidence([
+                bug_analysis.get("confidence", 0),
+                security_analysis.get("confidence", 0),
+                quality_analysis.get("confidence", 0)
+            ]),
+            "model_used": settings.DEFAULT_MODEL
+        }
     
-    async def _run_analysis(self, prompt: ChatPromptTemplate, context: Dict[str, Any]) -> Dict[str, Any]:
+    @_cached_analysis
+    async def _run_analysis(self, chain: LLMChain, context: Dict[str, Any]) -> Dict[str, Any]:
         """Run a specific analysis using LangChain"""
         try:
-            # Create chain
-            chain = LLMChain(llm=self.llm, prompt=prompt)
-            
-            # Run analysis
-            response = await chain.arun(**context)
+            # Run analysis, bounded to respect provider rate limits
+            async with _llm_semaphore:
+                response = (await chain.ainvoke(context))[chain.output_key]
             
             # Parse JSON response
             try:
-                return json.loads(response)
-            except json.JSONDecodeError:
+                return orjson.loads(response)
+            except orjson.JSONDecodeError:
                 logger.warning("Failed to parse JSON response, returning raw text")
                 return {"raw_response": response, "confidence": 50}
                 
@@ -260,29 +741,32 @@ Return your analysis in JSON format:
             return 0
         return sum(confidences) // len(confidences)
     
-    async def generate_review_summary(self, 
-                                    repository_name: str,
-                                    pr_title: str,
-                                    analysis_results: List[Dict[str, Any]]) -> str:
-        """Generate a summary of the code review"""
+    def _count_issues(self, analysis_results: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Count issues by type across analysis results"""
+        return {
+            "bugs": sum(len(result.get("bugs", [])) for result in analysis_results),
+            "security": sum(len(result.get("security_issues", [])) for result in analysis_results),
+            "quality": sum(len(result.get("quality_issues", [])) for result in analysis_results)
+        }
+    
+    def _build_summary_messages(self,
+                                repository_name: str,
+                                pr_title: str,
+                                files_analyzed: int,
+                                counts: Dict[str, int]) -> List[Any]:
+        """Build the chat messages for a review summary"""
         
-        try:
-            # Count issues by type
-            total_bugs = sum(len(result.get("bugs", [])) for result in analysis_results)
-            total_security = sum(len(result.get("security_issues", [])) for result in analysis_results)
-            total_quality = sum(len(result.get("quality_issues", [])) for result in analysis_results)
-            
-            summary_prompt = f"""
+        summary_prompt = f"""
 Generate a concise code review summary for:
 
 Repository: {repository_name}
 Pull Request: {pr_title}
 
 Analysis Results:
-- Files analyzed: {len(analysis_results)}
-- Bugs found: {total_bugs}
-- Security issues: {total_security}
-- Quality issues: {total_quality}
+- Files analyzed: {files_analyzed}
+- Bugs found: {counts["bugs"]}
+- Security issues: {counts["security"]}
+- Quality issues: {counts["quality"]}
 
 Provide a professional summary highlighting:
 1. Overall assessment
@@ -292,15 +776,47 @@ Provide a professional summary highlighting:
 
 Keep it concise and actionable.
 """
-            
-            messages = [
-                SystemMessage(content="You are an expert code reviewer providing professional feedback."),
-                HumanMessage(content=summary_prompt)
-            ]
-            
+        
+        return [
+            SystemMessage(content="You are an expert code reviewer providing professional feedback."),
+            HumanMessage(content=summary_prompt)
+        ]
+    
+    def _summary_fallback(self, counts: Dict[str, int]) -> str:
+        """Plain summary used when the LLM call fails"""
+        return f"Code review completed. Found {counts['bugs']} bugs, {counts['security']} security issues, and {counts['quality']} quality issues."
+    
+    async def generate_review_summary(self, 
+                                    repository_name: str,
+                                    pr_title: str,
+                                    analysis_results: List[Dict[str, Any]]) -> str:
+        """Generate a summary of the code review"""
+        
+        counts = self._count_issues(analysis_results)
+        
+        try:
+            messages = self._build_summary_messages(repository_name, pr_title, len(analysis_results), counts)
             response = await self.llm.ainvoke(messages)
             return response.content
             
         except Exception as e:
             logger.error(f"Error generating review summary: {str(e)}")
-            return f"Code review completed. Found {total_bugs} bugs, {total_security} security issues, and {total_quality} quality issues."
+            return self._summary_fallback(counts)
+    
+    async def generate_review_summary_stream(self,
+                                             repository_name: str,
+                                             pr_title: str,
+                                             analysis_results: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """Generate a summary of the code review, yielding text as it is produced"""
+        
+        counts = self._count_issues(analysis_results)
+        
+        try:
+            messages = self._build_summary_messages(repository_name, pr_title, len(analysis_results), counts)
+            async for chunk in self.llm.astream(messages):
+                if chunk.content:
+                    yield chunk.content
+                    
+        except Exception as e:
+            logger.error(f"Error streaming review summary: {str(e)}")
+            yield self._summary_fallback(counts)
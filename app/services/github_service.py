@@ -3,10 +3,12 @@ GitHub Integration Service
 """
 
 import hmac
+import asyncio
 import hashlib
-import json
+import httpx
 import logging
-from typing import Dict, List, Any, Optional
+from cachetools import TTLCache
+from typing import Dict, List, Any, Optional, Tuple
 from github import Github, GithubException
 from github.PullRequest import PullRequest
 from github.Repository import Repository
@@ -15,6 +17,25 @@ from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+_FILES_PER_PAGE = 100
+
+# One REST client shared by every GitHubService; closed on application shutdown
+_http = httpx.AsyncClient(
+    base_url="https://api.github.com",
+    headers={
+        "Authorization": f"Bearer {settings.GITHUB_TOKEN}",
+        "Accept": "application/vnd.github+json"
+    },
+    timeout=30
+)
+
+# Caps concurrent GitHub API requests across the process
+_request_semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
+
+async def close_http_client():
+    """Close the shared GitHub REST client"""
+    await _http.aclose()
+
 class GitHubService:
     """Service for GitHub API integration"""
     
@@ -22,25 +43,51 @@ class GitHubService:
         """Initialize GitHub service"""
         self.github = Github(settings.GITHUB_TOKEN)
         self.webhook_secret = settings.GITHUB_WEBHOOK_SECRET
+        # Keyed HMAC state is derived once; each request works on a copy
+        self._webhook_mac = hmac.new(
+            self.webhook_secret.encode('utf-8'),
+            digestmod=hashlib.sha256
+        )
+        # Repository lookups cost a round-trip to /repos/{owner}/{repo}
+        self._repo_cache: TTLCache[Tuple[str, str], Repository] = TTLCache(maxsize=256, ttl=300)
+        # Commits are immutable, so a resolved SHA can be reused for every comment on it
+        self._commit_cache: TTLCache[Tuple[str, str, str], Commit] = TTLCache(maxsize=1024, ttl=3600)
     
-    def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
-        """Verify GitHub webhook signature"""
+    def new_webhook_mac(self):
+        """Get a keyed HMAC object for incrementally hashing a webhook body"""
+        return self._webhook_mac.copy()
+    
+    def verify_webhook_digest(self, mac, signature: str) -> bool:
+        """Verify GitHub webhook signature against a fully fed HMAC object"""
         try:
-            expected_signature = 'sha256=' + hmac.new(
-                self.webhook_secret.encode('utf-8'),
-                payload,
-                hashlib.sha256
-            ).hexdigest()
+            if not signature.startswith('sha256='):
+                return False
             
-            return hmac.compare_digest(signature, expected_signature)
+            return hmac.compare_digest(mac.digest(), bytes.fromhex(signature[7:]))
+        except ValueError:
+            # Malformed hex from the sender is a failed check, not a server error
+            return False
         except Exception as e:
             logger.error(f"Error verifying webhook signature: {str(e)}")
             return False
     
+    def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
+        """Verify GitHub webhook signature"""
+        mac = self.new_webhook_mac()
+        mac.update(payload)
+        return self.verify_webhook_digest(mac, signature)
+    
     async def get_repository(self, owner: str, repo: str) -> Optional[Repository]:
         """Get repository by owner and name"""
+        key = (owner, repo)
+        repository = self._repo_cache.get(key)
+        if repository is not None:
+            return repository
+        
         try:
-            return self.github.get_repo(f"{owner}/{repo}")
+            repository = self.github.get_repo(f"{owner}/{repo}")
+            self._repo_cache[key] = repository
+            return repository
         except GithubException as e:
             logger.error(f"Error getting repository {owner}/{repo}: {str(e)}")
             return None
@@ -59,35 +106,53 @@ class GitHubService:
     async def get_pull_request_files(self, owner: str, repo: str, pr_number: int) -> List[Dict[str, Any]]:
         """Get files changed in a pull request"""
         try:
-            pr = await self.get_pull_request(owner, repo, pr_number)
-            if not pr:
-                return []
+            url = f"/repos/{owner}/{repo}/pulls/{pr_number}/files"
+            first = await self._get_page(url, 1)
+            first.raise_for_status()
+            pages = [first]
+            
+            # The Link header names the last page, so the rest can be fetched concurrently
+            last_url = first.links.get("last", {}).get("url")
+            if last_url:
+                last_page = int(httpx.URL(last_url).params.get("page", 1))
+                pages.extend(await asyncio.gather(*(
+                    self._get_page(url, page) for page in range(2, last_page + 1)
+                )))
             
             files = []
-            for file in pr.get_files():
-                files.append({
-                    "filename": file.filename,
-                    "status": file.status,
-                    "additions": file.additions,
-                    "deletions": file.deletions,
-                    "changes": file.changes,
-                    "patch": file.patch,
-                    "raw_url": file.raw_url,
-                    "blob_url": file.blob_url,
-                    "sha": file.sha
-                })
+            for page in pages:
+                page.raise_for_status()
+                for file in page.json():
+                    files.append({
+                        "filename": file["filename"],
+                        "status": file["status"],
+                        "additions": file["additions"],
+                        "deletions": file["deletions"],
+                        "changes": file["changes"],
+                        "patch": file.get("patch"),
+                        "raw_url": file["raw_url"],
+                        "blob_url": file["blob_url"],
+                        "sha": file["sha"]
+                    })
             
             return files
-        except GithubException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Error getting PR files for {owner}/{repo}#{pr_number}: {str(e)}")
             return []
     
+    async def _get_page(self, url: str, page: int) -> httpx.Response:
+        """Fetch one page of a paginated REST listing"""
+        async with _request_semaphore:
+            return await _http.get(url, params={"per_page": _FILES_PER_PAGE, "page": page})
+    
     async def get_file_content(self, owner: str, repo: str, file_path: str, ref: str = "main") -> Optional[str]:
         """Get file content from repository"""
         try:
             repository = await self.get_repository(owner, repo)
             if repository:
-                content = repository.get_contents(file_path, ref=ref)
+                # PyGithub blocks on the request, so it runs in a worker thread
+                async with _request_semaphore:
+                    content = await asyncio.to_thread(repository.get_contents, file_path, ref=ref)
                 if content:
                     return content.decoded_content.decode('utf-8')
             return None
@@ -109,9 +174,13 @@ class GitHubService:
             if not pr:
                 return False
             
+            commit = await self._get_commit(owner, repo, commit_sha or pr.head.sha)
+            if not commit:
+                return False
+            
             pr.create_review_comment(
                 body=body,
-                commit=pr.get_commits().reversed[0],  # Latest commit
+                commit=commit,
                 path=file_path,
                 line=line_number
             )
@@ -123,6 +192,20 @@ class GitHubService:
             logger.error(f"Error creating review comment: {str(e)}")
             return False
     
+    async def _get_commit(self, owner: str, repo: str, sha: str) -> Optional[Commit]:
+        """Get a commit object by SHA, reusing previously resolved commits"""
+        key = (owner, repo, sha)
+        commit = self._commit_cache.get(key)
+        if commit is not None:
+            return commit
+        
+        repository = await self.get_repository(owner, repo)
+        if not repository:
+            return None
+        commit = repository.get_commit(sha)
+        self._commit_cache[key] = commit
+        return commit
+    
     async def create_review(self, 
                           owner: str, 
                           repo: str, 
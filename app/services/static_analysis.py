@@ -2,29 +2,115 @@
 Static Analysis Service
 """
 
-import subprocess
-import json
+import asyncio
 import logging
-import tempfile
+import orjson
 import os
-from typing import Dict, List, Any, Optional
+import tempfile
+from bandit.core import config as bandit_config, manager as bandit_manager
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Tuple
 from pathlib import Path
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
-class StaticAnalysisService:
-    """Service for static code analysis using various tools"""
+# RAM-backed directory for snippets handed to external tools, where the platform has one
+_SNIPPET_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Caps files scanned at once across all reviews in this process; each scan holds a
+# Semgrep subprocess and a default-executor thread for Bandit
+_analysis_semaphore = asyncio.Semaphore(settings.ANALYSIS_CONCURRENCY)
+
+_EXTENSIONS: Mapping[str, str] = MappingProxyType({
+    'python': '.py',
+    'javascript': '.js',
+    'typescript': '.ts',
+    'java': '.java',
+    'cpp': '.cpp',
+    'c': '.c',
+    'go': '.go',
+    'rust': '.rs'
+})
+
+# Map language names to Semgrep language identifiers
+_SEMGREP_LANG: Mapping[str, str] = MappingProxyType({
+    'python': 'python',
+    'javascript': 'javascript',
+    'typescript': 'typescript',
+    'java': 'java',
+    'cpp': 'cpp',
+    'c': 'c',
+    'go': 'go',
+    'rust': 'rust'
+})
+
+async def _run_command(cmd: List[str], timeout: float) -> Tuple[int, bytes, str]:
+    """Run a command without blocking the event loop; stdout is left as bytes for orjson"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, stdout, stderr.decode()
+
+@lru_cache(maxsize=1)
+def _get_bandit_config() -> bandit_config.BanditConfig:
+    """Load the Bandit configuration once per worker"""
+    return bandit_config.BanditConfig()
+
+def _scan_with_bandit(code: bytes) -> List[Dict[str, Any]]:
+    """Run Bandit in-process on a code snippet without touching disk where possible"""
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("bandit-snippet")
+        try:
+            with os.fdopen(fd, "wb", closefd=False) as snippet:
+                snippet.write(code)
+            return _bandit_issues(f"/proc/self/fd/{fd}")
+        finally:
+            os.close(fd)
+    
+    with tempfile.NamedTemporaryFile(suffix=".py") as snippet:
+        snippet.write(code)
+        snippet.flush()
+        return _bandit_issues(snippet.name)
+
+def _bandit_issues(file_path: str) -> List[Dict[str, Any]]:
+    """Run Bandit in-process on a single file"""
+    b_mgr = bandit_manager.BanditManager(_get_bandit_config(), 'file')
+    b_mgr.discover_files([file_path])
+    b_mgr.run_tests()
     
-    def __init__(self):
-        """Initialize static analysis service"""
-        self.tools = {
-            "bandit": self._run_bandit,
-            "safety": self._run_safety,
-            "semgrep": self._run_semgrep
+    return [
+        {
+            "line": issue.lineno,
+            "type": "security",
+            "severity": issue.severity,
+            "title": issue.text or 'Security issue',
+            "description": f"{issue.test_id}: {issue.test}",
+            "tool": "bandit",
+            "confidence": 80
         }
+        for issue in b_mgr.get_issue_list()
+    ]
+
+class StaticAnalysisService:
+    """Service for static code analysis using various tools"""
     
     async def analyze_code(self, code: str, language: str, file_path: str) -> Dict[str, Any]:
         """Run static analysis on code"""
+        async with _analysis_semaphore:
+            return await self._analyze_code(code, language, file_path)
+    
+    async def _analyze_code(self, code: str, language: str, file_path: str) -> Dict[str, Any]:
+        """Run the static analysis tools on one file"""
         results = {
             "file_path": file_path,
             "language": language,
@@ -34,75 +120,38 @@ class StaticAnalysisService:
         }
         
         try:
-            # Create temporary file for analysis
-            with tempfile.NamedTemporaryFile(mode='w', suffix=self._get_file_extension(language), delete=False) as temp_file:
-                temp_file.write(code)
-                temp_file_path = temp_file.name
+            code_bytes = code.encode('utf-8')
+            language_key = language.lower()
+            semgrep_task = asyncio.create_task(self._run_semgrep(code_bytes, language_key))
+            
+            # Run different analysis tools based on language
+            if language_key in ('python', 'py'):
+                security_results, dependency_results = await asyncio.gather(
+                    self._run_bandit(code_bytes),
+                    self._run_safety(file_path)
+                )
+                results["security_issues"].extend(security_results)
+                results["dependency_issues"].extend(dependency_results)
+            
+            # Run Semgrep for multiple languages
+            semgrep_results = await semgrep_task
+            results["security_issues"].extend(semgrep_results.get("security", []))
+            results["quality_issues"].extend(semgrep_results.get("quality", []))
+            if semgrep_results.get("error"):
+                results["error"] = semgrep_results["error"]
             
-            try:
-                # Run different analysis tools based on language
-                if language.lower() in ['python', 'py']:
-                    security_results = await self._run_bandit(temp_file_path)
-                    results["security_issues"].extend(security_results)
-                    
-                    dependency_results = await self._run_safety(temp_file_path)
-                    results["dependency_issues"].extend(dependency_results)
-                
-                # Run Semgrep for multiple languages
-                semgrep_results = await self._run_semgrep(temp_file_path, language)
-                results["security_issues"].extend(semgrep_results.get("security", []))
-                results["quality_issues"].extend(semgrep_results.get("quality", []))
-                
-            finally:
-                # Clean up temporary file
-                os.unlink(temp_file_path)
-                
         except Exception as e:
             logger.error(f"Error in static analysis for {file_path}: {str(e)}")
             results["error"] = str(e)
         
         return results
     
-    def _get_file_extension(self, language: str) -> str:
-        """Get file extension for language"""
-        extensions = {
-            'python': '.py',
-            'javascript': '.js',
-            'typescript': '.ts',
-            'java': '.java',
-            'cpp': '.cpp',
-            'c': '.c',
-            'go': '.go',
-            'rust': '.rs'
-        }
-        return extensions.get(language.lower(), '.txt')
-    
-    async def _run_bandit(self, file_path: str) -> List[Dict[str, Any]]:
+    async def _run_bandit(self, code: bytes) -> List[Dict[str, Any]]:
         """Run Bandit security analysis"""
         try:
-            result = subprocess.run([
-                'bandit', '-f', 'json', file_path
-            ], capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                issues = []
-                for result_item in data.get('results', []):
-                    issues.append({
-                        "line": result_item.get('line_number'),
-                        "type": "security",
-                        "severity": result_item.get('issue_severity', 'medium'),
-                        "title": result_item.get('issue_text', 'Security issue'),
-                        "description": result_item.get('issue_description', ''),
-                        "tool": "bandit",
-                        "confidence": 80
-                    })
-                return issues
-            else:
-                logger.warning(f"Bandit analysis failed: {result.stderr}")
-                return []
+            return await asyncio.wait_for(asyncio.to_thread(_scan_with_bandit, code), timeout=30)
                 
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             logger.warning("Bandit analysis timed out")
             return []
         except Exception as e:
@@ -120,31 +169,23 @@ class StaticAnalysisService:
             logger.error(f"Error running Safety: {str(e)}")
             return []
     
-    async def _run_semgrep(self, file_path: str, language: str) -> Dict[str, List[Dict[str, Any]]]:
-        """Run Semgrep analysis"""
+    async def _run_semgrep(self, code: bytes, language: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Run Semgrep analysis; language is expected lower-cased"""
         try:
-            # Map language names to Semgrep language identifiers
-            lang_map = {
-                'python': 'python',
-                'javascript': 'javascript',
-                'typescript': 'typescript',
-                'java': 'java',
-                'cpp': 'cpp',
-                'c': 'c',
-                'go': 'go',
-                'rust': 'rust'
-            }
-            
-            semgrep_lang = lang_map.get(language.lower())
+            semgrep_lang = _SEMGREP_LANG.get(language)
             if not semgrep_lang:
                 return {"security": [], "quality": []}
             
-            result = subprocess.run([
-                'semgrep', '--config=auto', '--json', '--lang', semgrep_lang, file_path
-            ], capture_output=True, text=True, timeout=60)
+            # Semgrep picks files up by extension, so the snippet gets a suffixed path
+            with tempfile.NamedTemporaryFile(suffix=_EXTENSIONS.get(language, '.txt'), dir=_SNIPPET_DIR) as snippet:
+                snippet.write(code)
+                snippet.flush()
+                returncode, stdout, stderr = await _run_command([
+                    'semgrep', '--config=auto', '--json', '--lang', semgrep_lang, snippet.name
+                ], timeout=60)
             
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
+            if returncode == 0:
+                data = orjson.loads(stdout)
                 security_issues = []
                 quality_issues = []
                 
@@ -170,25 +211,25 @@ class StaticAnalysisService:
                     "quality": quality_issues
                 }
             else:
-                logger.warning(f"Semgrep analysis failed: {result.stderr}")
-                return {"security": [], "quality": []}
+                logger.warning(f"Semgrep analysis failed: {stderr}")
+                return {"security": [], "quality": [], "error": f"Semgrep exited with status {returncode}"}
                 
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             logger.warning("Semgrep analysis timed out")
-            return {"security": [], "quality": []}
+            return {"security": [], "quality": [], "error": "Semgrep analysis timed out"}
         except Exception as e:
             logger.error(f"Error running Semgrep: {str(e)}")
-            return {"security": [], "quality": []}
+            return {"security": [], "quality": [], "error": str(e)}
     
     async def analyze_dependencies(self, requirements_file: str) -> List[Dict[str, Any]]:
         """Analyze dependencies for vulnerabilities"""
         try:
-            result = subprocess.run([
+            returncode, stdout, stderr = await _run_command([
                 'safety', 'check', '--json', '--file', requirements_file
-            ], capture_output=True, text=True, timeout=60)
+            ], timeout=60)
             
-            if result.returncode != 0:  # Safety returns non-zero for vulnerabilities found
-                data = json.loads(result.stdout)
+            if returncode != 0:  # Safety returns non-zero for vulnerabilities found
+                data = orjson.loads(stdout)
                 issues = []
                 for item in data:
                     issues.append({
@@ -5,15 +5,18 @@ AI-powered code review assistant using LangChain
 
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer
+from contextlib import asynccontextmanager
 import uvicorn
 import os
 from dotenv import load_dotenv
 
 from app.api.routes import reviews, webhooks, dashboard
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.database import init_db
 from app.core.logging import setup_logging
+from app.services.github_service import close_http_client
 
 # Load environment variables
 load_dotenv()
@@ -21,8 +24,11 @@ load_dotenv()
 # Setup logging
 setup_logging()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release shared clients when the application shuts down"""
+    yield
+    await close_http_client()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -30,7 +36,9 @@ app = FastAPI(
     description="AI-powered code review assistant using LangChain",
     version="1.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -65,9 +73,16 @@ async def health_check():
     return {"status": "healthy", "service": "codesense-ai"}
 
 if __name__ == "__main__":
+    development = settings.ENVIRONMENT == "development"
+    # Create tables once here, before uvicorn spawns workers that would race on DDL
+    init_db()
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True if settings.ENVIRONMENT == "development" else False
+        loop="uvloop",
+        http="httptools",
+        # Reload mode only supports a single worker
+        workers=1 if development else (os.cpu_count() or 1),
+        reload=development
     )
@@ -34,6 +34,10 @@ if not exist frontend\node_modules (
     cd ..
 )
 
+REM Create database tables once, before the server starts
+echo 🗄️  Creating database tables...
+python -m app.core.database
+
 REM Start the application
 echo 🎯 Starting CodeSense AI...
 echo Backend: http://localhost:8000
@@ -34,6 +34,10 @@ if [ ! -d "frontend/node_modules" ]; then
     cd ..
 fi
 
+# Create database tables once, before the server starts
+echo "🗄️  Creating database tables..."
+python -m app.core.database
+
 # Start the application
 echo "🎯 Starting CodeSense AI..."
 echo "Backend: http://localhost:8000"
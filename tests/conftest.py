@@ -0,0 +1,11 @@
+"""
+Shared test configuration
+"""
+
+import os
+
+# Settings are required at import time; tests run with placeholder credentials
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("GITHUB_TOKEN", "test-github-token")
+os.environ.setdefault("GITHUB_WEBHOOK_SECRET", "test-webhook-secret")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
@@ -0,0 +1,280 @@
+"""
+Tests for code analysis prompt helpers
+"""
+
+import pytest
+from app.core.config import settings
+from app.services.code_analysis import CodeAnalysisService, _count_tokens, _ranges, _split_by_ast, _trim_code
+
+def test_ranges():
+    """Test collapsing changed lines into ranges"""
+    assert _ranges([36, 34, 35, 89, 150, 151]) == "34-36, 89, 150-151"
+    assert _ranges([5, 5, 5]) == "5"
+    assert _ranges([]) == "none"
+
+def test_ranges_truncates_long_lists():
+    """Test that very long line lists are capped with a remainder count"""
+    assert _ranges(list(range(0, 500, 2))).endswith("... (+50 more)")
+
+def test_trim_code_keeps_changed_context():
+    """Test that large files are cut down to the changed regions"""
+    code = "\n".join(f"line_{number} = {number}" for number in range(1, 501))
+    trimmed = _trim_code(code, [250], context=2)
+    assert trimmed.splitlines() == [
+        "... (lines 1-247 omitted) ...",
+        "  248| line_248 = 248",
+        "  249| line_249 = 249",
+        "  250| line_250 = 250",
+        "  251| line_251 = 251",
+        "  252| line_252 = 252",
+        "... (lines 253-500 omitted) ..."
+    ]
+
+def test_trim_code_leaves_small_files():
+    """Test that small files are passed through untouched"""
+    assert _trim_code("x = 1\ny = 2", [1]) == "x = 1\ny = 2"
+
+def test_split_by_ast_cuts_at_definitions(monkeypatch):
+    """Test that oversized Python files are split at top-level definitions"""
+    monkeypatch.setattr(settings, "MAX_INPUT_TOKENS", 16)
+    code = "def first():\n    return 1\n\n@decorated\ndef second():\n    return 2\n"
+    chunks = _split_by_ast(code, "python")
+    assert [first_line for first_line, _ in chunks] == [1, 4]
+    assert chunks[1][1].startswith("@decorated")
+
+def test_split_by_ast_fits_oversized_windows(monkeypatch):
+    """Test that every chunk fits the budget even when lines are token-dense"""
+    monkeypatch.setattr(settings, "MAX_INPUT_TOKENS", 40)
+    code = "\n".join(f"value_{number} = compute(alpha, beta, gamma, delta)" for number in range(300))
+    chunks = _split_by_ast(code, "go")
+    assert len(chunks) > 1
+    assert all(_count_tokens(text) <= 40 for _, text in chunks)
+    assert "\n".join(text for _, text in chunks) == code
+    assert [first_line for first_line, _ in chunks] == sorted(first_line for first_line, _ in chunks)
+
+@pytest.mark.asyncio
+async def test_analyze_chunks_shifts_lines_to_file_positions(monkeypatch):
+    """Test that chunk-relative finding lines are mapped back onto the file"""
+    monkeypatch.setattr(settings, "MAX_INPUT_TOKENS", 16)
+    service = CodeAnalysisService()
+    analyzed = []
+    
+    async def fake_analyze_context(context, deep):
+        analyzed.append(context["file_path"])
+        return {
+            "bugs": [{"line": 2, "title": "Bug"}],
+            "security_issues": [],
+            "quality_issues": [{"title": "No line"}],
+            "overall_confidence": 80,
+            "model_used": settings.SMALL_MODEL
+        }
+    
+    monkeypatch.setattr(service, "_analyze_context", fake_analyze_context)
+    code = "def first():\n    return 1\n\n@decorated\ndef second():\n    return 2\n"
+    
+    results = await service._analyze_chunks(code, "app.py", "python", "owner/repo", "PR", [2, 5], False)
+    
+    assert analyzed == ["app.py (lines 1-3)", "app.py (lines 4-7)"]
+    assert [bug["line"] for bug in results["bugs"]] == [2, 5]
+    assert results["quality_issues"] == [{"title": "No line"}, {"title": "No line"}]
+    
+    # Chunks without changed lines are skipped
+    analyzed.clear()
+    results = await service._analyze_chunks(code, "app.py", "python", "owner/repo", "PR", [5], False)
+    assert analyzed == ["app.py (lines 4-7)"]
+    assert [bug["line"] for bug in results["bugs"]] == [5]
+    assert "error" not in results
+
+@pytest.mark.asyncio
+async def test_analyze_chunks_reports_failed_chunk(monkeypatch):
+    """Test that an error in any chunk is kept on the merged result"""
+    monkeypatch.setattr(settings, "MAX_INPUT_TOKENS", 16)
+    service = CodeAnalysisService()
+    
+    async def fake_analyze_context(context, deep):
+        if context["file_path"].endswith("(lines 4-7)"):
+            return {"bugs": [], "error": "rate limited", "overall_confidence": 0}
+        return {"bugs": [], "overall_confidence": 80}
+    
+    monkeypatch.setattr(service, "_analyze_context", fake_analyze_context)
+    code = "def first():\n    return 1\n\n@decorated\ndef second():\n    return 2\n"
+    
+    results = await service._analyze_chunks(code, "app.py", "python", "owner/repo", "PR", [], False)
+    
+    assert results["error"] == "rate limited"
+
+def _stub_chains(monkeypatch, service, first_pass, escalation):
+    """Stub the LLM calls, recording which chains ran"""
+    calls = []
+    
+    async def fake_run_analysis(chain, context):
+        calls.append(chain)
+        return first_pass if chain is service.unified_chain else escalation
+    
+    monkeypatch.setattr(service, "_run_analysis", fake_run_analysis)
+    return calls
+
+_CONTEXT = {"file_path": "app.py"}
+_SQL_INJECTION = {"line": 3, "title": "SQL injection"}
+
+@pytest.mark.asyncio
+async def test_confident_clean_pass_stays_on_small_model(monkeypatch):
+    """Test that a confident first pass without security findings is not escalated"""
+    service = CodeAnalysisService()
+    calls = _stub_chains(monkeypatch, service, {"bugs": [], "security_issues": [], "confidence": 90}, {})
+    
+    results = await service._analyze_context(_CONTEXT, False)
+    
+    assert calls == [service.unified_chain]
+    assert results["model_used"] == settings.SMALL_MODEL
+
+@pytest.mark.asyncio
+async def test_security_finding_escalates_to_default_model(monkeypatch):
+    """Test that flagged security issues are re-checked and replaced by the default model"""
+    service = CodeAnalysisService()
+    confirmed = {"line": 3, "title": "SQL injection via string formatting"}
+    calls = _stub_chains(
+        monkeypatch, service,
+        {"security_issues": [_SQL_INJECTION], "confidence": 90},
+        {"security_issues": [confirmed]}
+    )
+    
+    results = await service._analyze_context(_CONTEXT, False)
+    
+    assert calls == [service.unified_chain, service.security_chain]
+    assert results["security_issues"] == [confirmed]
+    assert results["model_used"] == settings.DEFAULT_MODEL
+
+@pytest.mark.asyncio
+async def test_low_confidence_escalates_to_default_model(monkeypatch):
+    """Test that an unsure first pass is escalated even without security findings"""
+    service = CodeAnalysisService()
+    calls = _stub_chains(
+        monkeypatch, service,
+        {"security_issues": [], "confidence": settings.ESCALATION_CONFIDENCE_THRESHOLD - 10},
+        {"security_issues": []}
+    )
+    
+    results = await service._analyze_context(_CONTEXT, False)
+    
+    assert calls == [service.unified_chain, service.security_chain]
+    assert results["model_used"] == settings.DEFAULT_MODEL
+
+@pytest.mark.asyncio
+async def test_failed_escalation_keeps_first_pass(monkeypatch):
+    """Test that an errored escalation leaves the small model's findings in place"""
+    service = CodeAnalysisService()
+    _stub_chains(
+        monkeypatch, service,
+        {"security_issues": [_SQL_INJECTION], "confidence": 90},
+        {"error": "rate limited"}
+    )
+    
+    results = await service._analyze_context(_CONTEXT, False)
+    
+    assert results["security_issues"] == [_SQL_INJECTION]
+    assert results["model_used"] == settings.SMALL_MODEL
+
+@pytest.mark.asyncio
+async def test_failed_first_pass_reports_error(monkeypatch):
+    """Test that an errored first pass is reported even when the escalation succeeds"""
+    service = CodeAnalysisService()
+    calls = _stub_chains(
+        monkeypatch, service,
+        {"error": "rate limited", "confidence": 0},
+        {"security_issues": [_SQL_INJECTION]}
+    )
+    
+    results = await service._analyze_context(_CONTEXT, False)
+    
+    assert calls == [service.unified_chain, service.security_chain]
+    assert results["error"] == "rate limited"
+    assert results["security_issues"] == [_SQL_INJECTION]
+
+def _pr_files(count):
+    """Small files as analyze_pr receives them"""
+    return [
+        {"code": f"value_{index} = {index}\n", "file_path": f"file_{index}.py", "language": "python", "changed_lines": [1]}
+        for index in range(count)
+    ]
+
+@pytest.mark.asyncio
+async def test_analyze_pr_batches_small_files(monkeypatch):
+    """Test that small files share a first-pass call and keep their own results, in order"""
+    monkeypatch.setattr(settings, "ANALYSIS_BATCH_SIZE", 2)
+    service = CodeAnalysisService()
+    calls = []
+    
+    async def fake_run_analysis(chain, context):
+        calls.append(chain)
+        if chain is service.unified_batch_chain:
+            assert "### FILE 1: file_1.py" in context["files"]
+            return {"results": [
+                {"file_index": index, "bugs": [{"line": 1, "title": f"Bug {index}"}], "confidence": 90}
+                for index in range(2)
+            ]}
+        return {"bugs": [{"line": 1, "title": context["file_path"]}], "confidence": 90}
+    
+    monkeypatch.setattr(service, "_run_analysis", fake_run_analysis)
+    
+    results = await service.analyze_pr(_pr_files(3), "owner/repo", "PR")
+    
+    assert calls == [service.unified_batch_chain, service.unified_chain]
+    assert [result["file_path"] for result in results] == ["file_0.py", "file_1.py", "file_2.py"]
+    assert [result["bugs"][0]["title"] for result in results] == ["Bug 0", "Bug 1", "file_2.py"]
+    assert all(result["model_used"] == settings.SMALL_MODEL for result in results)
+
+@pytest.mark.asyncio
+async def test_analyze_pr_analyzes_files_missing_from_batch_response(monkeypatch):
+    """Test that files the batch response leaves out get their own first pass"""
+    service = CodeAnalysisService()
+    calls = []
+    
+    async def fake_run_analysis(chain, context):
+        calls.append(chain)
+        if chain is service.unified_batch_chain:
+            return {"results": [{"file_index": 0, "bugs": [], "confidence": 90}]}
+        return {"bugs": [{"line": 1, "title": context["file_path"]}], "confidence": 90}
+    
+    monkeypatch.setattr(service, "_run_analysis", fake_run_analysis)
+    
+    results = await service.analyze_pr(_pr_files(2), "owner/repo", "PR")
+    
+    assert calls == [service.unified_batch_chain, service.unified_chain]
+    assert results[0]["bugs"] == []
+    assert results[1]["bugs"] == [{"line": 1, "title": "file_1.py"}]
+
+@pytest.mark.asyncio
+async def test_analyze_pr_reports_failed_batch_per_file(monkeypatch):
+    """Test that a batch which raises yields an error result for each of its files"""
+    service = CodeAnalysisService()
+    
+    async def failing_batch(batch, repository_name, pr_title):
+        raise RuntimeError("malformed batch")
+    
+    monkeypatch.setattr(service, "_analyze_batch", failing_batch)
+    
+    results = await service.analyze_pr(_pr_files(2), "owner/repo", "PR")
+    
+    assert [result["file_path"] for result in results] == ["file_0.py", "file_1.py"]
+    assert all(result["error"] == "malformed batch" for result in results)
+
+@pytest.mark.asyncio
+async def test_analyze_pr_deep_skips_batching(monkeypatch):
+    """Test that deep analysis keeps the dedicated per-file prompts"""
+    service = CodeAnalysisService()
+    calls = []
+    
+    async def fake_run_analysis(chain, context):
+        calls.append(chain)
+        return {"confidence": 90}
+    
+    monkeypatch.setattr(service, "_run_analysis", fake_run_analysis)
+    
+    await service.analyze_pr(_pr_files(2), "owner/repo", "PR", deep=True)
+    
+    assert service.unified_batch_chain not in calls
+    assert len(calls) == 6
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,75 @@
+"""
+Tests for the review background task
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.api.routes import reviews
+from app.core.database import Base, CodeReview, ReviewSession
+from app.schemas.review import ReviewRequest
+
+@pytest.fixture
+def db():
+    """In-memory database shared with the worker threads the task commits from"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+@pytest.mark.asyncio
+async def test_failing_file_does_not_fail_the_session(db, monkeypatch):
+    """Test that a file whose fetch or static analysis raises is skipped"""
+    db.add(ReviewSession(session_id="session-1", repository_id=1, pull_request_id=1, status="pending"))
+    db.commit()
+    
+    async def fake_get_file_content(owner, repo, file_path, ref):
+        if file_path == "missing.py":
+            raise RuntimeError("connection reset")
+        return "x = 1\n"
+    
+    async def fake_analyze_pr(files, repository_name, pr_title, deep=False):
+        return [
+            {"file_path": file["file_path"], "bugs": [{"line": 1, "title": "Bug"}], "security_issues": []}
+            for file in files
+        ]
+    
+    async def fake_static_analyze(code, language, file_path):
+        if file_path == "broken.py":
+            raise RuntimeError("scanner crashed")
+        return {"security_issues": []}
+    
+    async def fake_summary(repository_name, pr_title, analysis_results):
+        return "Summary"
+    
+    monkeypatch.setattr(reviews.github_service, "get_file_content", fake_get_file_content)
+    monkeypatch.setattr(reviews.code_analysis_service, "analyze_pr", fake_analyze_pr)
+    monkeypatch.setattr(reviews.code_analysis_service, "generate_review_summary", fake_summary)
+    monkeypatch.setattr(reviews.static_analysis_service, "analyze_code", fake_static_analyze)
+    
+    request = ReviewRequest(
+        repository_id=1,
+        pull_request_id=1,
+        owner="owner",
+        repo="repo",
+        pr_number=1,
+        pr_title="PR",
+        head_sha="head",
+        base_sha="base",
+        files=[{"path": "missing.py"}, {"path": "broken.py"}, {"path": "ok.py"}]
+    )
+    await reviews._run_code_analysis("session-1", request, db)
+    
+    session = db.query(ReviewSession).filter(ReviewSession.session_id == "session-1").one()
+    assert session.status == "completed"
+    bug_files = [review.file_path for review in db.query(CodeReview).filter(CodeReview.review_type == "bug")]
+    assert sorted(bug_files) == ["broken.py", "ok.py"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,65 @@
+"""
+Tests for the static analysis service
+"""
+
+import os
+import shutil
+import orjson
+import pytest
+from app.services import static_analysis
+from app.services.static_analysis import StaticAnalysisService
+
+VULNERABLE_SNIPPET = b"import subprocess\n\ndef run(cmd):\n    subprocess.call(cmd, shell=True)\n"
+
+@pytest.mark.asyncio
+async def test_semgrep_scans_a_suffixed_file(monkeypatch):
+    """Test that Semgrep gets a path with the language extension and its findings are parsed"""
+    seen = {}
+    
+    async def fake_run_command(cmd, timeout):
+        target = cmd[-1]
+        seen["suffix"] = os.path.splitext(target)[1]
+        with open(target, "rb") as snippet:
+            seen["code"] = snippet.read()
+        output = {"results": [
+            {"start": {"line": 4}, "extra": {"message": "Shell injection", "severity": "ERROR", "metadata": {"category": "security"}}},
+            {"start": {"line": 3}, "extra": {"message": "Style", "severity": "INFO", "metadata": {"category": "best-practice"}}}
+        ]}
+        return 0, orjson.dumps(output), ""
+    
+    monkeypatch.setattr(static_analysis, "_run_command", fake_run_command)
+    results = await StaticAnalysisService()._run_semgrep(VULNERABLE_SNIPPET, "python")
+    
+    assert seen == {"suffix": ".py", "code": VULNERABLE_SNIPPET}
+    assert [issue["line"] for issue in results["security"]] == [4]
+    assert [issue["line"] for issue in results["quality"]] == [3]
+
+@pytest.mark.asyncio
+async def test_semgrep_failure_is_reported(monkeypatch):
+    """Test that a failing Semgrep run surfaces an error instead of an empty result"""
+    
+    async def fake_run_command(cmd, timeout):
+        return 2, b"", "invalid configuration"
+    
+    monkeypatch.setattr(static_analysis, "_run_command", fake_run_command)
+    results = await StaticAnalysisService()._run_semgrep(VULNERABLE_SNIPPET, "python")
+    
+    assert results["security"] == [] and results["quality"] == []
+    assert "status 2" in results["error"]
+
+@pytest.mark.asyncio
+async def test_bandit_flags_shell_injection():
+    """Test that in-process Bandit finds a known issue in a snippet"""
+    issues = await StaticAnalysisService()._run_bandit(VULNERABLE_SNIPPET)
+    assert any(issue["line"] == 4 for issue in issues)
+
+@pytest.mark.skipif(shutil.which("semgrep") is None, reason="semgrep is not installed")
+@pytest.mark.asyncio
+async def test_semgrep_finds_shell_injection():
+    """Test a real Semgrep run against a known-vulnerable snippet"""
+    results = await StaticAnalysisService()._run_semgrep(VULNERABLE_SNIPPET, "python")
+    assert "error" not in results
+    assert any(issue["line"] == 4 for issue in results["security"] + results["quality"])
+
+if __name__ == "__main__":
+    pytest.main([__file__])
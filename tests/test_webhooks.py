@@ -0,0 +1,179 @@
+"""
+Tests for GitHub webhook helpers
+"""
+
+import hashlib
+import hmac
+import pytest
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.routes import webhooks
+from app.api.routes.webhooks import _detect_language, _extract_changed_lines
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.schemas.webhook import WebhookPayload
+
+PAYLOAD = b'{"action": "opened", "repository": {"full_name": "owner/repo"}}'
+
+class _FakeResult:
+    """Result of the inbox INSERT ... RETURNING"""
+    
+    def scalar(self):
+        return 1
+
+class _FakeSession:
+    """Async session stand-in for the webhook request path"""
+    
+    def __init__(self):
+        self.bind = SimpleNamespace(dialect=SimpleNamespace(name="sqlite"))
+        self.failures = 0
+    
+    async def execute(self, stmt):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        return _FakeResult()
+    
+    async def commit(self):
+        pass
+
+@pytest.fixture
+def session(monkeypatch):
+    """Webhook route wired to a fake session, with background processing stubbed out"""
+    fake_session = _FakeSession()
+    
+    async def _skip_processing(*args):
+        pass
+    
+    monkeypatch.setattr(webhooks, "_process_webhook", _skip_processing)
+    webhooks._recent_deliveries.clear()
+    return fake_session
+
+@pytest.fixture
+def client(session):
+    """Test client for an app serving only the webhook routes"""
+    app = FastAPI()
+    app.include_router(webhooks.router, prefix="/api/v1/webhooks")
+    
+    async def _get_fake_db():
+        yield session
+    
+    app.dependency_overrides[get_async_db] = _get_fake_db
+    return TestClient(app)
+
+def _sign(body: bytes) -> str:
+    """Sign a body the way GitHub does"""
+    return "sha256=" + hmac.new(settings.GITHUB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+def _deliver(client, body=PAYLOAD, signature=None, delivery_id="delivery-1"):
+    """Post a pull_request delivery to the webhook endpoint"""
+    return client.post(
+        "/api/v1/webhooks/github",
+        content=body,
+        headers={
+            "X-GitHub-Event": "pull_request",
+            "X-GitHub-Delivery": delivery_id,
+            "X-Hub-Signature-256": _sign(body) if signature is None else signature
+        }
+    )
+
+def test_detect_language():
+    """Test language detection from file extension"""
+    assert _detect_language("app/main.py") == "python"
+    assert _detect_language("src/App.TSX") == "typescript"
+    assert _detect_language("config.yml") == "yaml"
+    assert _detect_language("archive.tar.gz") == "unknown"
+
+def test_detect_language_without_extension():
+    """Test language detection for files without an extension"""
+    assert _detect_language("Makefile") == "unknown"
+    assert _detect_language("") == "unknown"
+
+def test_extract_changed_lines():
+    """Test added-line numbering from a git patch"""
+    patch = "@@ -1,3 +1,4 @@ def main():\n+import os\n x = 1\n+y = 2\n@@ -10 +12,2 @@\n-old\n+new\n\\ No newline at end of file"
+    assert _extract_changed_lines(patch) == [1, 3, 12]
+    assert _extract_changed_lines("") == []
+    assert _extract_changed_lines(None) == []
+
+def test_extract_changed_lines_ignores_other_line_breaks():
+    """Test that form feeds and similar characters inside a line don't shift numbering"""
+    patch = "@@ -1,3 +1,4 @@\n x = 1\x0cy\n+added\n z\n"
+    assert _extract_changed_lines(patch) == [2]
+
+def test_webhook_accepts_signed_delivery(client):
+    """Test that a correctly signed delivery is accepted"""
+    response = _deliver(client)
+    assert response.status_code == 200
+    assert response.json() == {"status": "accepted", "event": "pull_request"}
+
+def test_webhook_rejects_bad_signature(client):
+    """Test that a delivery signed with another secret is rejected"""
+    bad_signature = "sha256=" + hmac.new(b"other-secret", PAYLOAD, hashlib.sha256).hexdigest()
+    assert _deliver(client, signature=bad_signature).status_code == 401
+
+def test_webhook_rejects_malformed_signature_hex(client):
+    """Test that an unparsable signature is a 401, not a server error"""
+    assert _deliver(client, signature="sha256=not-hex").status_code == 401
+
+def test_webhook_rejects_oversized_body(client, monkeypatch):
+    """Test that bodies over the configured limit are refused by Content-Length"""
+    monkeypatch.setattr(settings, "WEBHOOK_MAX_BODY_BYTES", len(PAYLOAD) - 1)
+    assert _deliver(client).status_code == 413
+
+def test_webhook_skips_repeated_delivery(client):
+    """Test that a redelivered id is acknowledged without being processed again"""
+    assert _deliver(client).json()["status"] == "accepted"
+    response = _deliver(client)
+    assert response.status_code == 200
+    assert response.json() == {"status": "duplicate", "event": "pull_request"}
+
+def test_webhook_processes_retry_after_server_error(client, session):
+    """Test that a delivery which failed with a 500 is processed when GitHub retries it"""
+    session.failures = 1
+    assert _deliver(client).status_code == 500
+    assert _deliver(client).json()["status"] == "accepted"
+
+def test_webhook_unsigned_delivery_does_not_claim_id(client):
+    """Test that a rejected delivery leaves its id free for the genuine one"""
+    assert _deliver(client, signature="sha256=" + "0" * 64).status_code == 401
+    assert _deliver(client).json()["status"] == "accepted"
+
+def test_webhook_unsigned_repeat_is_not_acknowledged(client):
+    """Test that a seen delivery id does not bypass signature verification"""
+    assert _deliver(client).json()["status"] == "accepted"
+    assert _deliver(client, signature="sha256=" + "0" * 64).status_code == 401
+
+def test_webhook_malformed_body_does_not_claim_id(client):
+    """Test that a signed but unparsable delivery leaves its id free for a retry"""
+    assert _deliver(client, body=b"{not json").status_code == 400
+    assert _deliver(client).json()["status"] == "accepted"
+
+@pytest.mark.asyncio
+async def test_pr_event_rewrites_changed_repository_fields(session, monkeypatch):
+    """Test that the repository id cache skips the upsert only while the fields are unchanged"""
+    written = []
+    
+    async def fake_upsert_repository(db, fields):
+        written.append(fields["url"])
+        return 7
+    
+    monkeypatch.setattr(webhooks, "_upsert_repository", fake_upsert_repository)
+    webhooks._repo_id_cache.clear()
+    repository = {
+        "id": 1,
+        "name": "repo",
+        "full_name": "owner/repo",
+        "owner": {"login": "owner"},
+        "html_url": "https://github.com/owner/repo"
+    }
+    
+    for html_url in ("https://github.com/owner/repo", "https://github.com/owner/repo", "https://example.com/owner/repo"):
+        payload = WebhookPayload(action="edited", pull_request={"number": 1}, repository={**repository, "html_url": html_url})
+        await webhooks._persist_pr_event(payload, session)
+    
+    assert written == ["https://github.com/owner/repo", "https://example.com/owner/repo"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])